@@ -4,27 +4,169 @@ This script appends CRC-32s to the end of the files in a directory.
 This is intended for anime fansubbing releases.
 You can change what it checks by modifying the 'ext' (extension) on L47.
 Can be run both from the command line, and imported.
+
+Optional dependencies:
+ - xxhash       (https://github.com/ifduyue/python-xxhash) (for .xxh manifests)
 """
 import argparse
 import binascii
-import glob
-import mimetypes
+import hashlib
+import json
+import mmap
 import os
 import re
-from typing import Literal
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Literal, Optional, Tuple
+
+import discovery
+import fileutil
+import telemetry
+
+try:
+    import xxhash
+
+    _xxhash_available = True
+except ImportError:
+    _xxhash_available = False
 
 __author__ = "LightArrowsEXE"
 __license__ = 'MIT'
-__version__ = '1.3'
+__version__ = '1.4'
 
 
 crc32_hash: Literal = r'\s?\[[0-9a-fA-F]{8}\]'
 
+# Files that get a CRC: Matroska, plus the video types of Python's built-in mimetypes table.
+# Transport streams and raw streams are left alone, renaming BDMV/STREAM/00000.m2ts would break a disc's structure.
+video_extensions = frozenset({
+    '.avi', '.m1v', '.mkv', '.mov', '.movie', '.mp4', '.mpa', '.mpe', '.mpeg', '.mpg', '.qt', '.webm',
+})
+
+# Read size used when hashing. Memory use is bounded by this, not the file size.
+default_bufsize: int = 1024 * 1024
+
+
+class _CRC32:
+    """hashlib-style wrapper around binascii.crc32."""
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def update(self, data) -> None:
+        self.value = binascii.crc32(data, self.value)
 
-def calculate_crc(f) -> str:
+    def hexdigest(self) -> str:
+        return "%08X" % (self.value & 0xFFFFFFFF)
+
+
+# Supported digests, keyed by the extension of the manifest they're written to.
+digests: Dict[str, Callable] = {'sfv': _CRC32, 'md5': hashlib.md5}
+
+if _xxhash_available:
+    digests['xxh'] = xxhash.xxh64
+
+
+def _feed_readinto(f, bufsize: int, hashers: list) -> None:
+    # A single buffer is allocated up front and refilled for every chunk.
+    buf = bytearray(bufsize)
+    view = memoryview(buf)
+    with open(f, 'rb', buffering=0) as file:
+        while (n := file.readinto(buf)):
+            chunk = view[:n]
+            for h in hashers:
+                h.update(chunk)
+
+
+def _feed_mmap(f, bufsize: int, hashers: list) -> None:
     with open(f, 'rb') as file:
-        calc = file.read()
-    return "%08X" % (binascii.crc32(calc) & 0xFFFFFFFF)
+        if os.fstat(file.fileno()).st_size == 0:  # empty files can't be mapped
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mm) as view:
+                for offset in range(0, len(mm), bufsize):
+                    chunk = view[offset:offset + bufsize]
+                    for h in hashers:
+                        h.update(chunk)
+                    chunk.release()
+
+
+def calculate_digests(f, kinds: Iterable[str] = ('sfv',),
+                      bufsize: int = default_bufsize, use_mmap: bool = False) -> Dict[str, str]:
+    """
+    Calculate every requested digest of a file in a single pass,
+    reading it in chunks of `bufsize` bytes through either
+    a reused read buffer or a memory-mapped view.
+    """
+    hashers = {kind: digests[kind]() for kind in kinds}
+    (_feed_mmap if use_mmap else _feed_readinto)(f, bufsize, list(hashers.values()))
+    return {kind: h.hexdigest().upper() for kind, h in hashers.items()}
+
+
+def calculate_crc(f, bufsize: int = default_bufsize, use_mmap: bool = False) -> str:
+    return calculate_digests(f, ('sfv',), bufsize, use_mmap)['sfv']
+
+
+class CRCCache:
+    """
+    Persistent CRC cache, stored as a JSON sidecar in every directory it covers.
+
+    Entries are keyed by (device, inode, size, mtime_ns), so renaming a file
+    keeps its entry valid while any change to its contents invalidates it.
+    """
+    filename = '.crc32cache.json'
+
+    def __init__(self, rehash: bool = False) -> None:
+        self.rehash = rehash
+        self._dirs: Dict[str, Dict[str, dict]] = {}
+
+    @staticmethod
+    def key(f) -> str:
+        st = os.stat(f)
+        return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+    def _entries(self, f) -> Dict[str, dict]:
+        d = os.path.dirname(os.path.abspath(f))
+        if d not in self._dirs:
+            try:
+                with open(os.path.join(d, self.filename), encoding='utf-8') as file:
+                    self._dirs[d] = json.load(file)
+            except (OSError, ValueError):
+                self._dirs[d] = {}
+        return self._dirs[d]
+
+    def get(self, f) -> Optional[str]:
+        entries = self._entries(f)
+        if self.rehash:
+            return None
+        entry = entries.get(self.key(f))
+        return entry['crc'] if entry else None
+
+    def put(self, f, crc: str) -> None:
+        self._entries(f)[self.key(f)] = {'name': os.path.basename(f), 'crc': crc}
+
+    def save(self) -> None:
+        """Evict entries for files that no longer exist and write every sidecar back."""
+        for d, entries in self._dirs.items():
+            present = {}
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name != self.filename:
+                        # DirEntry.stat() has no inode on Windows, so stat the path itself
+                        present[self.key(entry.path)] = entry.name
+
+            kept = {k: {**v, 'name': present[k]} for k, v in entries.items() if k in present}
+            path = os.path.join(d, self.filename)
+            if not kept:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+
+            fileutil.write_json(path, kept, indent=1, sort_keys=True)
 
 
 def strip_crc(f) -> None:
@@ -33,23 +175,178 @@ def strip_crc(f) -> None:
         print(f"[-] {f} wrong CRC stripped")
 
 
-def main() -> None:
-    files = glob.glob('**/*' if args.recursive else '*', recursive=True)
+def get_files() -> List[str]:
+    return [m.path for m in discovery.walk(recursive=args.recursive, extensions=video_extensions)]
+
+
+def benchmark(files: List[str], sizes=(64, 256, 1024, 4096, 16384)) -> None:
+    """Compare hashing throughput for different chunk sizes and read modes."""
+    temp = None
+    if not files:
+        # Nothing to hash, so benchmark against a throwaway 256 MiB file instead
+        fd, temp = tempfile.mkstemp(suffix='.mkv')
+        with os.fdopen(fd, 'wb') as file:
+            for _ in range(256):
+                file.write(os.urandom(1024 * 1024))
+        files = [temp]
+
+    try:
+        total = sum(os.path.getsize(f) for f in files)
+        print(f"[#] Benchmarking {len(files)} file(s), {total / 1e6:.1f} MB")
+        for f in files:  # warm up the page cache so the first run isn't penalised
+            calculate_crc(f)
+
+        for use_mmap in (False, True):
+            for kib in sizes:
+                start = time.perf_counter()
+                for f in files:
+                    calculate_crc(f, kib * 1024, use_mmap)
+                elapsed = time.perf_counter() - start
+                mode = 'mmap' if use_mmap else 'readinto'
+                print(f"[#] {mode:>8} {kib:>6} KiB: {total / elapsed / 1e6:8.1f} MB/s")
+    finally:
+        if temp:
+            os.remove(temp)
+
+
+def apply_crc(f, crc: str) -> str:
+    if re.search(crc, f):
+        print(f"[*] {f}, correct CRC already present in filename")
+        return f
+
+    strip_crc(f)
+    str_f = re.sub(crc32_hash, '', f)
+    new_f = f'{os.path.splitext(str_f)[0]} [{crc}]{os.path.splitext(str_f)[1]}'
+    os.rename(str_f, new_f)
+    print(f"[+] {f}, CRC: [{crc}]")
+    return new_f
+
+
+def write_manifests(entries: Dict[str, Dict[str, str]], kinds: Iterable[str]) -> None:
+    """Write a manifest per requested digest, named after the current directory."""
+    name = os.path.basename(os.getcwd())
+    for kind in kinds:
+        path = f"{name}.{kind}"
+        lines = [f"; Generated by auto-CRC.py v{__version__}\n"] if kind == 'sfv' else []
+        for f, digest in sorted(entries.items()):
+            f = f.replace(os.sep, '/')
+            if kind == 'sfv':
+                lines.append(f"{f} {digest[kind]}\n")
+            else:  # md5sum/xxhsum style
+                lines.append(f"{digest[kind].lower()}  {f}\n")
+        fileutil.write_atomic(path, "".join(lines))
+        print(f"[+] Wrote {path} ({len(entries)} files)")
+
+
+def read_manifest(path) -> Dict[str, Tuple[str, str]]:
+    """Parse an .sfv/.md5/.xxh manifest into {file: (kind, digest)}."""
+    kind = os.path.splitext(path)[1][1:].lower()
+    base = os.path.dirname(path)
+    entries = {}
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith(';'):
+                continue
+            if kind == 'sfv':
+                f, digest = line.rsplit(None, 1)
+            else:
+                digest, f = line.split(None, 1)
+                f = f.lstrip('*')
+            entries[os.path.normpath(os.path.join(base, f))] = (kind, digest.upper())
+    return entries
+
+
+def verify(files: List[str]) -> bool:
+    """
+    Verify files against every manifest found, falling back to the CRC in the filename.
+    Every file is read once, no matter how many digests it is checked against.
+    """
+    expected: Dict[str, Dict[str, str]] = {}
+    for manifest in discovery.walk(recursive=args.recursive, extensions={f'.{kind}' for kind in digests}):
+        for f, (k, digest) in read_manifest(manifest.path).items():
+            expected.setdefault(f, {})[k] = digest
 
     for f in files:
-        mime = mimetypes.types_map.get(os.path.splitext(f)[-1], "")
-        if mime.startswith("video/") or f.endswith('.mkv'):
-            if args.strip:
-                strip_crc(f)
+        tags = re.findall(r'\[([0-9a-fA-F]{8})\]', os.path.basename(f))
+        if tags:
+            expected.setdefault(os.path.normpath(f), {}).setdefault('sfv', tags[-1].upper())
+
+    def check(f) -> Tuple[Optional[Dict[str, str]], float]:
+        if not os.path.isfile(f):
+            return None, 0.0
+        start = time.perf_counter()
+        with telemetry.measure('auto-CRC', f, __version__, op='verify', bytes=os.path.getsize(f)) as event:
+            result = calculate_digests(f, expected[f], args.bufsize * 1024, args.mmap)
+            if any(result[k] != digest for k, digest in expected[f].items()):
+                event['status'] = 'failed'
+        return result, time.perf_counter() - start
+
+    ok = True
+    names = sorted(expected)
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        for f, (result, elapsed) in zip(names, pool.map(check, names)):
+            if result is None:
+                print(f"[!] {f}, missing")
+                ok = False
+                continue
+
+            bad = [k for k, digest in expected[f].items() if result[k] != digest]
+            speed = os.path.getsize(f) / max(elapsed, 1e-9) / 1e6
+            if bad:
+                print(f"[!] {f}, mismatch: {', '.join(bad)} ({speed:.1f} MB/s)")
+                ok = False
             else:
-                crc = calculate_crc(f)
-                if re.search(crc, f):
-                    print(f"[*] {f}, correct CRC already present in filename")
-                else:
-                    strip_crc(f)
-                    str_f = re.sub(crc32_hash, '', f)
-                    os.rename(str_f, f'{os.path.splitext(str_f)[0]} [{crc}]{os.path.splitext(str_f)[1]}')
-                    print(f"[+] {f}, CRC: [{crc}]")
+                print(f"[*] {f}, OK: {', '.join(expected[f])} ({speed:.1f} MB/s)")
+
+    print(f"\n{'All files verified' if ok else 'Verification failed'} ({len(names)} files)")
+    return ok
+
+
+def main() -> None:
+    files = get_files()
+
+    if args.verify:
+        sys.exit(0 if verify(files) else 1)
+
+    if args.benchmark:
+        benchmark(files)
+        return
+
+    if args.strip:
+        for f in files:
+            strip_crc(f)
+        return
+
+    kinds = ['sfv', *(k for k in args.manifest or () if k != 'sfv')]
+    cache = None if args.no_cache else CRCCache(rehash=args.rehash)
+    # Only the CRC is cached, so other manifest digests always need a full read.
+    cached = {f: cache.get(f) for f in files} if cache and kinds == ['sfv'] else {}
+
+    def hash_file(f) -> Dict[str, str]:
+        with telemetry.measure('auto-CRC', f, __version__, op='hash') as event:
+            if (crc := cached.get(f)):
+                event['cache'] = 'hit'
+                return {'sfv': crc}
+            event.update(bytes=os.path.getsize(f), cache='miss' if f in cached else None)
+            return calculate_digests(f, kinds, args.bufsize * 1024, args.mmap)
+
+    # binascii.crc32 releases the GIL on large buffers, so threads hash in parallel,
+    # while files are still renamed one at a time, in the order they were found.
+    entries = {}
+    try:
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            for f, digest in zip(files, pool.map(hash_file, files)):
+                new_f = apply_crc(f, digest['sfv'])
+                entries[os.path.normpath(new_f)] = digest
+                if cache:
+                    cache.put(new_f, digest['sfv'])
+    finally:
+        if cache:
+            cache.save()
+
+    if args.manifest:
+        write_manifests(entries, args.manifest)
 
 
 if __name__ == "__main__":
@@ -60,7 +357,39 @@ if __name__ == "__main__":
     parser.add_argument("-S", "--strip",
                         action="store_true", default=False,
                         help="strip CRCs from filenames (default: %(default)s)")
+    parser.add_argument("-B", "--bufsize",
+                        action="store", type=int, default=default_bufsize // 1024,
+                        help="read size in KiB used when hashing (default: %(default)s)")
+    parser.add_argument("--mmap",
+                        action="store_true", default=False,
+                        help="hash through memory-mapped reads (default: %(default)s)")
+    parser.add_argument("-J", "--jobs",
+                        action="store", type=int, default=1,
+                        help="number of files to hash at the same time (default: %(default)s)")
+    parser.add_argument("--no-cache",
+                        action="store_true", default=False,
+                        help="do not read or write the CRC cache (default: %(default)s)")
+    parser.add_argument("--rehash",
+                        action="store_true", default=False,
+                        help="ignore cached CRCs and hash every file again (default: %(default)s)")
+    parser.add_argument("-M", "--manifest",
+                        action="store", nargs="+", choices=tuple(digests), default=None,
+                        help="write checksum manifests for the matched files (default: %(default)s)")
+    parser.add_argument("-V", "--verify",
+                        action="store_true", default=False,
+                        help="verify files against their manifests or filename CRCs instead of renaming (default: %(default)s)")
+    parser.add_argument("--benchmark",
+                        action="store_true", default=False,
+                        help="compare hashing throughput across buffer sizes instead of renaming (default: %(default)s)")
+    parser.add_argument("--telemetry",
+                        action="store", default=None, metavar="LOG",
+                        help="append an event per hashed file to this JSON-lines log (default: %(default)s)")
     parser.parse_args()
     args = parser.parse_args()
 
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    telemetry.configure(args.telemetry)
+
     main()
@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+"""
+    Benchmarks every utility offline, on synthetic fixtures generated in a scratch directory.
+
+    Suites:
+     - crc          random (or sparse) files for auto-CRC.py: single/multi-threaded, mmap, cached and verify runs
+     - prune        a deep and wide directory tree for remove_empty_directories.py
+     - clean        a release folder full of files to clean up for clean_dir.py
+     - encode       fake sources for encode_audio.py, piped and sequential
+     - remux        fake sources for remux.py, including a run where every output is up to date
+     - keyframes    BlankClip-based Y4M clips with hard cuts for generate_keyframes.py (needs VapourSynth)
+
+    ffmpeg, ffprobe, qaac, flac and eac3to are replaced by a stub (through runner.py's RUNNER_<TOOL> variables)
+    that waits --latency seconds and writes --output-mb of output, so no encoders are needed
+    and the numbers only reflect the scripts themselves.
+
+    Every case runs as its own process, once to warm up and then --repeat times.
+    The median wall time is reported, along with CPU time and peak memory from wait4:
+    CPU time includes every process the script started, peak memory is that of the largest one.
+    Where a script records telemetry, the median MB/s or fps of the files that weren't cache hits is shown too.
+    Reports can be written to JSON with --output and compared against an earlier one with --compare.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import fileutil
+import runner
+import telemetry
+
+__author__ = "LightArrowsEXE"
+__license__ = 'MIT'
+__version__ = '1.0'
+
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+suites = ['crc', 'prune', 'clean', 'encode', 'remux', 'keyframes']
+
+# Tools replaced by the stub, and the extensions clean_dir.py should move out of the way
+stubbed_tools = ['ffmpeg', 'ffprobe', 'qaac', 'flac', 'eac3to']
+clutter = ['.ass', '.txt', '.png', '.lwi', '.ffindex', '.vpy']
+
+stub_source = '''#!{python}
+"""Stand-in for ffmpeg, ffprobe, qaac, flac and eac3to, named after the tool it's pretending to be."""
+import os
+import sys
+import time
+
+tool = os.path.basename(sys.argv[0])
+args = sys.argv[1:]
+
+
+def setting(name, default):
+    return float(os.environ.get(f"STUB_{{tool.upper()}}_{{name}}") or os.environ.get(f"STUB_{{name}}") or default)
+
+
+time.sleep(setting("LATENCY", 0))
+
+if tool == "ffprobe":
+    print("60.000000" if any("format=duration" in a for a in args) else "sample_fmt=s16\\nbits_per_raw_sample=16")
+    sys.exit(0)
+
+if tool in ("qaac", "flac"):
+    src, out = args[-1], args[args.index("-o") + 1]
+elif tool == "ffmpeg":
+    src, out = args[args.index("-i") + 1], args[-1]
+else:  # eac3to source [track:] output
+    src, out = args[0], args[-1]
+
+if src == "-":
+    while sys.stdin.buffer.read(1 << 20):
+        pass
+
+left = int(setting("OUTPUT_MB", 1) * (1 << 20))
+chunk = bytes(1 << 20)
+with (open(sys.stdout.fileno(), "wb", closefd=False) if out == "-" else open(out, "wb")) as file:
+    try:
+        while left > 0:
+            left -= file.write(chunk[:left])
+    except BrokenPipeError:
+        sys.exit(1)
+'''
+
+
+class Case(NamedTuple):
+    suite: str
+    name: str
+    cmd: List[str]
+    cwd: str
+    # Run before every run, warm-up included, and not timed
+    prepare: Optional[Callable[[], None]] = None
+
+
+def script(name: str) -> str:
+    return os.path.join(here, name)
+
+
+def write_stubs(workdir: str) -> Dict[str, str]:
+    """Write the stub and link it under every tool's name, returning the RUNNER_<TOOL> variables to use it."""
+    stubs = os.path.join(workdir, 'stubs')
+    os.makedirs(stubs, exist_ok=True)
+    stub = os.path.join(stubs, 'stub.py')
+    with open(stub, 'w', encoding='utf-8') as file:
+        file.write(stub_source.format(python=sys.executable))
+    os.chmod(stub, 0o755)
+
+    env = {}
+    for tool in stubbed_tools:
+        link = os.path.join(stubs, tool)
+        if not os.path.lexists(link):
+            os.symlink(stub, link)
+        env[f"RUNNER_{tool.upper()}"] = link
+    return env
+
+
+def make_files(d: str, count: int, size: int, ext: str = '.mkv', sparse: bool = False) -> None:
+    """Files of random data, or sparse files that read back as zeroes without touching the disk."""
+    os.makedirs(d, exist_ok=True)
+    for i in range(count):
+        with open(os.path.join(d, f"[Fixture] Episode {i + 1:02}{ext}"), 'wb') as file:
+            if sparse:
+                file.truncate(size)
+                continue
+            left = size
+            while left > 0:
+                left -= file.write(os.urandom(min(left, 1 << 20)))
+
+
+def make_tree(root: str, count: int) -> Callable[[], None]:
+    """A deep and wide tree of mostly empty directories, rebuilt from scratch every time it's called."""
+    def build() -> None:
+        # Imported here, since it's only needed for this suite
+        from remove_empty_directories import build_tree
+
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        build_tree(root, count)
+    return build
+
+
+def make_release(root: str, dirs: int, files: int) -> Callable[[], None]:
+    """A release folder with a few videos to keep, and a lot of clutter spread over subdirectories."""
+    def build() -> None:
+        shutil.rmtree(root, ignore_errors=True)
+        for d in range(dirs):
+            sub = os.path.join(root, *(f"level{depth}" for depth in range(d % 4 + 1)), f"set{d}")
+            os.makedirs(sub, exist_ok=True)
+            for i in range(files):
+                ext = '.mkv' if i % 10 == 0 else clutter[i % len(clutter)]
+                with open(os.path.join(sub, f"file{i}{ext}"), 'wb') as file:
+                    file.write(b'\0' * 4096)
+    return build
+
+
+def remove_outputs(d: str, exts) -> Callable[[], None]:
+    def clean() -> None:
+        for name in os.listdir(d):
+            if name.endswith(tuple(exts)):
+                os.remove(os.path.join(d, name))
+    return clean
+
+
+def make_clips(d: str, count: int, scenes: int, scene_length: int) -> bool:
+    """Y4M clips of flat scenes with a hard cut every `scene_length` frames. Returns False without VapourSynth."""
+    try:
+        import vapoursynth as vs
+    except ImportError:
+        return False
+
+    core = vs.core
+    os.makedirs(d, exist_ok=True)
+    for i in range(count):
+        clip = core.std.Splice([
+            core.std.BlankClip(format=vs.YUV420P8, width=640, height=360, length=scene_length,
+                               color=[(s * 37 + i) % 220 + 16, (s * 53) % 224 + 16, (s * 71) % 224 + 16])
+            for s in range(scenes)
+        ])
+        with open(os.path.join(d, f"clip{i + 1:02}.y4m"), 'wb') as file:
+            clip.output(file, y4m=True)
+    return True
+
+
+def build_cases(workdir: str) -> List[Case]:
+    """Generate the fixtures for every selected suite, and the cases to run on them."""
+    scale, jobs = args.scale, args.jobs
+    cases = []
+
+    if 'crc' in args.suites:
+        d = os.path.join(workdir, 'crc')
+        count, size = max(1, round(8 * scale)), 64 << 20
+        print(f"[*] crc: {count} {'sparse' if args.sparse else 'random'} files of {size / 1e6:.1f} MB")
+        make_files(d, count, size, sparse=args.sparse)
+        crc = [sys.executable, script('auto-CRC.py')]
+        cases += [
+            Case('crc', '1 job', [*crc, '--no-cache'], d),
+            Case('crc', f'{jobs} jobs', [*crc, '--no-cache', '-J', str(jobs)], d),
+            Case('crc', 'mmap', [*crc, '--no-cache', '--mmap', '-J', str(jobs)], d),
+            # The warm-up run fills the cache
+            Case('crc', 'cached', crc, d),
+            Case('crc', f'verify, {jobs} jobs', [*crc, '-V', '-J', str(jobs)], d),
+        ]
+
+    if 'prune' in args.suites:
+        d = os.path.join(workdir, 'prune')
+        count = max(10, round(50_000 * scale))
+        print(f"[*] prune: tree of {count} directories")
+        prune = [sys.executable, script('remove_empty_directories.py')]
+        cases += [
+            Case('prune', '1 job', prune, d, make_tree(d, count)),
+            Case('prune', f'{jobs} jobs', [*prune, '-J', str(jobs)], d, make_tree(d, count)),
+        ]
+
+    if 'clean' in args.suites:
+        d = os.path.join(workdir, 'clean')
+        dirs, files = max(1, round(200 * scale)), 50
+        print(f"[*] clean: {dirs} directories of {files} files")
+        clean = [sys.executable, script('clean_dir.py'), '-R']
+        cases += [
+            Case('clean', 'dry run', [*clean, '-n'], d, make_release(d, dirs, files)),
+            Case('clean', 'move', clean, d, make_release(d, dirs, files)),
+            Case('clean', 'move, keep tree', [*clean, '-T'], d, make_release(d, dirs, files)),
+        ]
+
+    for suite, exts in (('encode', ('.flac', '.m4a', '.opus', '.wav')), ('remux', ('.mka',))):
+        if suite not in args.suites:
+            continue
+        d = os.path.join(workdir, suite)
+        count = max(1, round(8 * scale))
+        print(f"[*] {suite}: {count} sources, stubs with {args.latency}s latency and {args.output_mb} MB output")
+        # Matroska audio for encode_audio, which never picks up .mkv or any of its own outputs
+        make_files(d, count, 4 << 20, '.mka' if suite == 'encode' else '.mkv')
+        if suite == 'encode':
+            encode = [sys.executable, script('encode_audio.py'), '--keep', '--no-manifest']
+            cases += [
+                Case('encode', 'pipeline, 1 job', encode, d, remove_outputs(d, exts)),
+                Case('encode', f'pipeline, {jobs} jobs', [*encode, '-J', str(jobs)], d, remove_outputs(d, exts)),
+                Case('encode', f'sequential, {jobs} jobs', [*encode, '-S', '-J', str(jobs)], d,
+                     remove_outputs(d, exts)),
+            ]
+        else:
+            remux = [sys.executable, script('remux.py'), '-o', 'mka']
+            cases += [
+                Case('remux', '1 job', [*remux, '-f'], d),
+                Case('remux', f'{jobs} jobs', [*remux, '-f', '-J', str(jobs)], d),
+                # The warm-up run leaves every output in place
+                Case('remux', 'up to date', [*remux, '-J', str(jobs)], d),
+            ]
+
+    if 'keyframes' in args.suites:
+        d = os.path.join(workdir, 'keyframes')
+        count = max(1, round(4 * scale))
+        if make_clips(d, count, scenes=24, scene_length=48):
+            print(f"[*] keyframes: {count} clips of {24 * 48} frames")
+            keyframes = [sys.executable, script('generate_keyframes.py'), '-f', '-L', 'WARNING',
+                         '--cache-dir', os.path.join(workdir, 'keyframe-cache')]
+            cases += [
+                Case('keyframes', '1 job', [*keyframes, '--no-cache'], d),
+                Case('keyframes', f'{jobs} jobs', [*keyframes, '--no-cache', '-J', str(jobs)], d),
+                # The warm-up run fills the cache
+                Case('keyframes', 'cached', keyframes, d),
+            ]
+        else:
+            print("[!] keyframes: skipped, VapourSynth isn't installed")
+
+    return cases
+
+
+def throughput(log: str) -> Optional[float]:
+    """Median MB/s (or fps, where frames were counted) of the files that weren't cache hits."""
+    if not os.path.exists(log):
+        return None
+    events = [e for e in telemetry.read_events([log]) if e.get('cache') != 'hit']
+    for key in ('fps', 'mb_s'):
+        if (values := sorted(e[key] for e in events if e.get(key))):
+            return telemetry.percentile(values, 50)
+    return None
+
+
+def run_case(case: Case, env: Dict[str, str], workdir: str) -> dict:
+    usages = []
+    log = os.path.join(workdir, 'telemetry', f"{case.suite}-{case.name}.jsonl".replace(' ', '_').replace(',', ''))
+    # Some scripts wait for Enter before they exit
+    enter = os.path.join(workdir, 'enter.txt')
+
+    for i in range(args.warmup + args.repeat):
+        if case.prepare:
+            case.prepare()
+        # Only the timed runs go into the telemetry log
+        run_env = {**env, telemetry.env_var: log} if i >= args.warmup else env
+        with open(enter, 'rb') as stdin, \
+                runner.Process(case.cmd, args.timeout, cwd=case.cwd, env=run_env, stdin=stdin,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) as proc:
+            proc.wait()
+        if proc.returncode:
+            print(f"[!] {case.suite}: {case.name} failed (exit status {proc.returncode}), "
+                  f"run it in {case.cwd} to see why")
+            break
+        if i >= args.warmup:
+            usages.append(proc.usage)
+
+    walls = [u.wall for u in usages]
+    cpus = [u.cpu for u in usages if u.cpu is not None]
+    rss = [u.max_rss_mb for u in usages if u.max_rss_mb is not None]
+    return {
+        'suite': case.suite,
+        'case': case.name,
+        'runs': len(usages),
+        'returncode': proc.returncode,
+        'wall': round(statistics.median(walls), 4) if walls else None,
+        'wall_min': round(min(walls), 4) if walls else None,
+        'cpu': round(statistics.median(cpus), 4) if cpus else None,
+        'peak_rss_mb': round(max(rss), 1) if rss else None,
+        'throughput': throughput(log),
+    }
+
+
+def load_baseline(path: Optional[str]) -> Dict[tuple, dict]:
+    if not path:
+        return {}
+    with open(path, encoding='utf-8') as file:
+        return {(r['suite'], r['case']): r for r in json.load(file)['results']}
+
+
+def print_result(r: dict, baseline: Dict[tuple, dict]) -> None:
+    def num(value, fmt: str, unit: str = '') -> str:
+        return f"{format(value, fmt)}{unit}" if value is not None else f"{'-':>{int(fmt.split('.')[0]) + len(unit)}}"
+
+    line = (f"  {r['suite']:<10} {r['case']:<22} {num(r['wall'], '8.3f', 's')} {num(r['wall_min'], '8.3f', 's')} "
+            f"{num(r['cpu'], '8.3f', 's')} {num(r['peak_rss_mb'], '8.1f', ' MB')} {num(r['throughput'], '10.1f')}")
+    if (old := baseline.get((r['suite'], r['case']))) and old['wall'] and r['wall']:
+        line += f"  {(r['wall'] - old['wall']) / old['wall']:+7.1%}"
+    print(line)
+
+
+def main() -> None:
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='benchmarks_')
+    os.makedirs(workdir, exist_ok=True)
+    baseline = load_baseline(args.compare)
+
+    try:
+        env = {**os.environ, **write_stubs(workdir),
+               'STUB_LATENCY': str(args.latency), 'STUB_OUTPUT_MB': str(args.output_mb)}
+        env.pop(telemetry.env_var, None)
+        os.makedirs(os.path.join(workdir, 'telemetry'), exist_ok=True)
+        with open(os.path.join(workdir, 'enter.txt'), 'w') as file:
+            file.write('\n')
+
+        cases = build_cases(workdir)
+        print(f"\n[*] {len(cases)} cases, {args.warmup} warm-up and {args.repeat} timed run(s) each\n")
+        print(f"  {'suite':<10} {'case':<22} {'median':>9} {'min':>9} {'cpu':>9} {'peak RSS':>11} {'MB/s|fps':>10}"
+              + ("  vs base" if baseline else ""))
+
+        results = []
+        for case in cases:
+            results.append(run_case(case, env, workdir))
+            print_result(results[-1], baseline)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"\n[*] Fixtures kept in {workdir}")
+
+    if args.output:
+        report = {
+            'version': __version__,
+            'python': sys.version.split()[0],
+            'cpu_count': os.cpu_count(),
+            'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'workdir', 'keep')},
+            'results': results,
+        }
+        fileutil.write_json(args.output, report, indent=1)
+        print(f"\n[+] Report written to {args.output}")
+
+    if any(r['returncode'] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("suites",
+                        nargs="*", default=suites, metavar="SUITE",
+                        help=f"suites to run: {', '.join(suites)} (default: all)")
+    parser.add_argument("-J", "--jobs",
+                        action="store", type=int, default=4,
+                        help="number of jobs the parallel cases use (default: %(default)s)")
+    parser.add_argument("-r", "--repeat",
+                        action="store", type=int, default=3,
+                        help="number of timed runs per case (default: %(default)s)")
+    parser.add_argument("--warmup",
+                        action="store", type=int, default=1,
+                        help="number of untimed runs per case first (default: %(default)s)")
+    parser.add_argument("-s", "--scale",
+                        action="store", type=float, default=1.0,
+                        help="scale the number and size of the fixtures by this factor (default: %(default)s)")
+    parser.add_argument("--sparse",
+                        action="store_true", default=False,
+                        help="use sparse files for the crc suite, which take no disk space or time to write (default: %(default)s)")
+    parser.add_argument("--latency",
+                        action="store", type=float, default=0.05,
+                        help="seconds every stubbed tool waits before doing anything (default: %(default)s)")
+    parser.add_argument("--output-mb",
+                        action="store", type=float, default=8.0,
+                        help="MB of output every stubbed tool writes (default: %(default)s)")
+    parser.add_argument("--timeout",
+                        action="store", type=float, default=None,
+                        help="kill any run that takes longer than this many seconds (default: %(default)s)")
+    parser.add_argument("-w", "--workdir",
+                        action="store", default=None,
+                        help="directory to generate the fixtures in (default: a temporary directory)")
+    parser.add_argument("-k", "--keep",
+                        action="store_true", default=False,
+                        help="keep the fixtures and telemetry logs afterwards (default: %(default)s)")
+    parser.add_argument("-o", "--output",
+                        action="store", default=None,
+                        help="write the report to this JSON file (default: %(default)s)")
+    parser.add_argument("-c", "--compare",
+                        action="store", default=None,
+                        help="compare the wall times against an earlier --output report (default: %(default)s)")
+    args = parser.parse_args()
+
+    if unknown := sorted(set(args.suites) - set(suites)):
+        parser.error(f"unknown suites: {', '.join(unknown)} (pick from: {', '.join(suites)})")
+    if args.jobs < 1 or args.repeat < 1 or args.warmup < 0 or args.scale <= 0:
+        parser.error("--jobs and --repeat must be at least 1, --warmup at least 0 and --scale positive")
+
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+    Checks how long the scripts take to start, using `python -X importtime`.
+
+    Every script is started with --help a couple of times, and the fastest run is reported,
+    along with the imports that took the longest.
+    Exits with an error if a script loads any of the heavy modules (VapourSynth and friends) just to start,
+    or if it takes longer than the given budget, so startup regressions get caught.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+__author__ = "LightArrowsEXE"
+__license__ = 'MIT'
+__version__ = '1.0'
+
+
+# Scripts that should start without loading anything heavy
+scripts = ['generate_keyframes.py', 'indexer.py']
+
+# Modules that should only be imported once a file actually needs decoding
+heavy_modules = {'vapoursynth', 'vstools', 'vssource', 'lvsfunc', 'colorlog'}
+
+importtime_line = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(script: str) -> Dict[str, Tuple[int, int]]:
+    """Self and cumulative import time in microseconds of every module the script imports at startup."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", script, "--help"],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode:
+        raise RuntimeError(f"{script} --help failed:\n{proc.stderr}")
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if (m := importtime_line.match(line)):
+            times[m[4]] = (int(m[1]), int(m[2]))
+    return times
+
+
+def check(script: str) -> bool:
+    runs = [import_times(script) for _ in range(args.runs)]
+    # Summing the self times counts every module once, however deeply it's nested
+    totals = [sum(self_us for self_us, _ in t.values()) / 1000 for t in runs]
+    total_ms = min(totals)
+    best = runs[totals.index(total_ms)]
+
+    print(f"[*] {script}: {total_ms:.1f} ms in imports ({len(best)} modules)")
+    for name, (_, cumulative) in sorted(best.items(), key=lambda i: -i[1][1])[:args.top]:
+        print(f"      {cumulative / 1000:8.1f} ms  {name}")
+
+    ok = True
+    if (loaded := sorted({name.split('.')[0] for name in best} & heavy_modules)):
+        print(f"[!] {script} loads {', '.join(loaded)} at startup")
+        ok = False
+    if args.budget and total_ms > args.budget:
+        print(f"[!] {script} takes longer than the {args.budget} ms budget")
+        ok = False
+    return ok
+
+
+def main() -> None:
+    failed = [s for s in args.scripts or scripts if not check(s)]
+    if failed:
+        sys.exit(1)
+    print("[+] Startup is fine")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scripts",
+                        nargs="*",
+                        help=f"scripts to check (default: {', '.join(scripts)})")
+    parser.add_argument("-n", "--runs",
+                        action="store", type=int, default=3,
+                        help="number of times to start every script, the fastest run counts (default: %(default)s)")
+    parser.add_argument("-b", "--budget",
+                        action="store", type=float, default=None,
+                        help="fail if the imports of a script take longer than this many milliseconds (default: %(default)s)")
+    parser.add_argument("--top",
+                        action="store", type=int, default=5,
+                        help="number of slowest imports to show (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+    Checks that generate_keyframes.py's segmented scene detection gives the same keyframes as a sequential pass.
+
+    Keyframes.from_clip is replaced by a fake detector, so this runs without VapourSynth or any plugins.
+    The detector forces a keyframe on a clip's first frame, like the real one,
+    and only finds a cut once it has seen a number of frames before it (its history).
+    Every clip gets random cuts, plus cuts on and right next to every segment boundary.
+
+    For every segment count and overlap:
+     - an overlap below 1 has to be rejected, since the forced keyframes would show up at every seam
+     - an overlap of at least the detector's history has to match the sequential result exactly
+     - anything in between can't see every cut, and is only reported
+"""
+import argparse
+import random
+import sys
+from typing import List, Optional
+
+import generate_keyframes as gk
+
+__author__ = "LightArrowsEXE"
+__license__ = 'MIT'
+__version__ = '1.0'
+
+
+class FakeClip:
+    """Just enough of a VideoNode for detect_keyframes: a frame count, slicing, and the cuts it contains."""
+
+    def __init__(self, cuts: List[int], start: int, end: int) -> None:
+        self.cuts, self.start, self.end = cuts, start, end
+        self.num_frames = end - start
+
+    def __getitem__(self, s: slice) -> 'FakeClip':
+        return FakeClip(self.cuts, self.start + s.start, self.start + (self.num_frames if s.stop is None else s.stop))
+
+
+class FakeKeyframes(list):
+    # Frames a cut needs before it, within the clip that's scanned, to be found
+    history = 1
+
+    @classmethod
+    def from_clip(cls, clip: FakeClip, mode=None) -> 'FakeKeyframes':
+        found = [c - clip.start for c in clip.cuts if clip.start + cls.history <= c < clip.end]
+        return cls(sorted({0, *found}))
+
+
+def make_cuts(rng: random.Random, num_frames: int, segments: int) -> List[int]:
+    cuts = set(rng.sample(range(1, num_frames), k=num_frames // 40))
+    for start, _ in gk.segment_bounds(num_frames, segments)[1:]:
+        cuts.update(f for f in (start - 1, start, start + 1) if 0 < f < num_frames)
+    return sorted(cuts)
+
+
+def check(segments: int, overlap: int, history: int, rng: random.Random) -> Optional[bool]:
+    """True if every clip matches, False on a mismatch, None if the result isn't expected to match."""
+    FakeKeyframes.history = history
+
+    for _ in range(args.clips):
+        num_frames = rng.randint(args.frames // 2, args.frames)
+        clip = FakeClip(make_cuts(rng, num_frames, segments), 0, num_frames)
+        sequential = FakeKeyframes.from_clip(clip)
+
+        try:
+            stitched = gk.detect_keyframes(clip, None, segments, overlap)
+        except ValueError:
+            if overlap < 1:
+                continue
+            print(f"[!] segments={segments} overlap={overlap}: rejected a valid overlap")
+            return False
+
+        if overlap < 1:
+            print(f"[!] segments={segments} overlap={overlap}: accepted, and gave {list(stitched)[:12]}...")
+            return False
+
+        if stitched != sequential:
+            missing = sorted(set(sequential) - set(stitched))
+            extra = sorted(set(stitched) - set(sequential))
+            if overlap < history:
+                return None
+            print(f"[!] segments={segments} overlap={overlap} history={history}, {num_frames} frames: "
+                  f"missing {missing}, extra {extra}")
+            return False
+    return True
+
+
+def main() -> None:
+    gk.Keyframes = FakeKeyframes
+    rng = random.Random(args.seed)
+
+    failed = 0
+    for history in args.history:
+        for segments in args.segments:
+            results = {overlap: check(segments, overlap, history, rng) for overlap in args.overlaps}
+            failed += sum(r is False for r in results.values())
+            shown = ", ".join(f"{o}: {'ok' if r else 'MISMATCH' if r is False else 'differs (overlap < history)'}"
+                              for o, r in results.items())
+            print(f"[*] history={history} segments={segments}: {shown}")
+
+    if failed:
+        print(f"\n[!] {failed} combination(s) failed")
+        sys.exit(1)
+    print("\n[+] Segmented detection matches sequential detection")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--segments",
+                        action="store", type=int, nargs="+", default=[2, 3, 4, 7],
+                        help="segment counts to check (default: %(default)s)")
+    parser.add_argument("-o", "--overlaps",
+                        action="store", type=int, nargs="+", default=[-5, 0, 1, 2, 8, 250],
+                        help="overlaps to check, including invalid ones (default: %(default)s)")
+    parser.add_argument("--history",
+                        action="store", type=int, nargs="+", default=[1, 8],
+                        help="frames the fake detector needs before a cut to find it (default: %(default)s)")
+    parser.add_argument("-n", "--clips",
+                        action="store", type=int, default=20,
+                        help="random clips per combination (default: %(default)s)")
+    parser.add_argument("-f", "--frames",
+                        action="store", type=int, default=2000,
+                        help="maximum length of the random clips (default: %(default)s)")
+    parser.add_argument("--seed",
+                        action="store", type=int, default=0,
+                        help="seed for the random clips (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.clips < 1 or args.frames < 100:
+        parser.error("--clips must be at least 1 and --frames at least 100")
+
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+    Cleans a final release folder.
+    Only the files with the given extension are kept, everything else is moved into "!_Cleaned Files".
+
+    Moves are planned first and can be previewed with --dry-run.
+    Files are renamed into place when they're on the same drive, so nothing is copied,
+    and files with the same name get a numbered name instead of overwriting each other.
+
+    Please note that this does NOT remove empty directories. See remove_empty_directories.py for that.
+"""
+import argparse
+import os
+import sys
+
+import discovery
+import mover
+
+__author__ = "LightArrowsEXE"
+__license__ = 'MIT'
+__version__ = '2.0'
+
+
+def get_files(ext: str):
+    return [m.path for m in discovery.walk(recursive=args.recursive, ignore={*discovery.ignored_dirs, args.dest})
+            if not m.path.endswith(ext)]
+
+
+def main() -> None:
+    ext = f".{(args.extension or 'mkv').lstrip('.')}"
+    print(f"Cleaning up everything without the {ext} extension\n")
+
+    moves = mover.plan(get_files(ext), os.path.join(os.getcwd(), args.dest),
+                       root='.' if args.keep_tree else None)
+
+    failed = 0
+    if args.dry_run:
+        for m in moves:
+            print(f"[*] '{m.src}' -> '{os.path.relpath(m.dst)}'")
+    else:
+        for r in mover.execute(moves, jobs=args.jobs, verify=not args.no_verify):
+            if r.method == 'failed':
+                print(f"[!] Could not clean '{r.src}': {r.error}")
+                failed += 1
+            else:
+                print(f"Cleaned '{r.src}' -> '{os.path.relpath(r.dst)}' ({r.method})")
+
+    print('-------------------------------------------------\nRemaining files:\n')
+    for f in discovery.walk(recursive=args.recursive, ignore={*discovery.ignored_dirs, args.dest}):
+        print(f"'{f.path}'")
+
+    print('\n\nPlease ensure that all the relevant files are included')
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-R", "--recursive",
+                        action="store_true", default=False,
+                        help="check recursively (default: %(default)s)")
+    parser.add_argument("-E", "--extension",
+                        help="extension of the files to keep (default: mkv)")
+    parser.add_argument("-D", "--dest",
+                        action="store", default="!_Cleaned Files",
+                        help="directory to move everything else into (default: %(default)s)")
+    parser.add_argument("-T", "--keep-tree",
+                        action="store_true", default=False,
+                        help="keep the directory structure inside the destination (default: %(default)s)")
+    parser.add_argument("-n", "--dry-run",
+                        action="store_true", default=False,
+                        help="only print where everything would be moved (default: %(default)s)")
+    parser.add_argument("-J", "--jobs",
+                        action="store", type=int, default=1,
+                        help="number of files to move at the same time, "
+                             "only helps when copying to another drive (default: %(default)s)")
+    parser.add_argument("--no-verify",
+                        action="store_true", default=False,
+                        help="don't read copies back to check them when moving to another drive (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    main()
@@ -0,0 +1,176 @@
+"""
+    Shared media discovery for the scripts in this repository.
+
+    Walks a directory tree once with os.scandir, pruning ignored directories,
+    and classifies files by extension through a lookup table that's built once,
+    so no file is opened or probed just to find out what it is.
+    Files are yielded as they're found, so work can start before the walk is done.
+
+    A snapshot (a file path, or a dict that's kept in memory) can optionally be passed to `walk`.
+    Directories whose mtime hasn't changed since the last walk are then listed from the snapshot
+    instead of being scanned again.
+"""
+import json
+import mimetypes
+import os
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Union
+
+import fileutil
+
+__author__ = "LightArrowsEXE"
+__license__ = 'MIT'
+__version__ = '1.0'
+
+
+# Directories that never contain anything worth processing
+ignored_dirs = frozenset({'__pycache__', '!_Cleaned Files'})
+
+# Containers and codecs that mimetypes doesn't know about, or classifies as something else
+extra_types: Dict[str, str] = {
+    '.mkv': 'video/x-matroska',
+    '.m2ts': 'video/mp2t',
+    '.ts': 'video/mp2t',
+    '.mts': 'video/mp2t',
+    '.m2v': 'video/mpeg',
+    '.vob': 'video/mpeg',
+    '.webm': 'video/webm',
+    '.264': 'video/h264',
+    '.h264': 'video/h264',
+    '.265': 'video/h265',
+    '.h265': 'video/h265',
+    '.hevc': 'video/h265',
+    '.ivf': 'video/x-ivf',
+    '.y4m': 'video/x-yuv4mpeg',
+    '.mka': 'audio/x-matroska',
+    '.flac': 'audio/flac',
+    '.opus': 'audio/opus',
+    '.m4a': 'audio/mp4',
+    '.thd': 'audio/vnd.dolby.mlp',
+    '.dts': 'audio/vnd.dts',
+    '.ac3': 'audio/ac3',
+    '.eac3': 'audio/eac3',
+    '.w64': 'audio/x-w64',
+    '.ass': 'text/x-ssa',
+    '.srt': 'application/x-subrip',
+}
+
+
+def _build_types() -> Dict[str, str]:
+    types = {ext.lower(): mime for ext, mime in mimetypes.types_map.items()}
+    types.update(extra_types)
+    return types
+
+
+# Lowercase extension -> mimetype, built once at import
+types_map: Dict[str, str] = _build_types()
+
+
+class MediaFile(NamedTuple):
+    path: str
+    mime: str
+
+    @property
+    def kind(self) -> str:
+        """The major mimetype ('video', 'audio', ...), or an empty string if unknown."""
+        return self.mime.split('/', 1)[0]
+
+    @property
+    def ext(self) -> str:
+        return os.path.splitext(self.path)[1].lower()
+
+
+def classify(path: str) -> str:
+    """Mimetype of a file based on its extension alone."""
+    return types_map.get(os.path.splitext(path)[1].lower(), "")
+
+
+def _load_snapshot(path: Union[str, dict, None]) -> Dict[str, dict]:
+    if isinstance(path, dict):
+        return dict(path)
+    if not path:
+        return {}
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_snapshot(path: Union[str, dict], snapshot: Dict[str, dict]) -> None:
+    if isinstance(path, dict):
+        path.clear()
+        path.update(snapshot)
+        return
+
+    fileutil.write_json(path, snapshot, separators=(',', ':'))
+
+
+def _list_dir(path: str, old: Dict[str, dict], new: Dict[str, dict]):
+    """List a directory's files and subdirectories, from the snapshot if it hasn't changed."""
+    mtime = os.stat(path).st_mtime_ns
+    cached = old.get(path)
+
+    if cached and cached['mtime_ns'] == mtime:
+        new[path] = cached
+        return cached['files'], cached['dirs']
+
+    files, dirs = [], []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                # Don't follow directory symlinks, so links back up the tree can't loop forever
+                (dirs if entry.is_dir(follow_symlinks=False) else files).append(entry.name)
+            except OSError:
+                continue
+
+    files.sort()
+    dirs.sort()
+    new[path] = {'mtime_ns': mtime, 'files': files, 'dirs': dirs}
+    return files, dirs
+
+
+def walk(root: str = '.', recursive: bool = True, kinds: Optional[Iterable[str]] = None,
+         extensions: Optional[Iterable[str]] = None, ignore: Iterable[str] = ignored_dirs,
+         snapshot: Union[str, dict, None] = None) -> Iterator[MediaFile]:
+    """
+    Lazily yield the files under `root`, depth-first and sorted by name within every directory.
+
+    Like glob, hidden files and directories are skipped, and paths are relative to `root` if it's '.'.
+    `kinds` ('video', 'audio', ...) and `extensions` ('.mkv', ...) filter what's yielded;
+    a file is yielded if it matches either of them.
+    """
+    kinds = set(kinds) if kinds is not None else None
+    extensions = {e.lower() for e in extensions} if extensions is not None else None
+    ignore = set(ignore)
+
+    old, new = _load_snapshot(snapshot), {}
+    stack = [root]
+
+    while stack:
+        d = stack.pop()
+        prefix = '' if d == '.' else d
+
+        try:
+            files, dirs = _list_dir(d, old, new)
+        except OSError:
+            continue
+
+        for name in files:
+            if name.startswith('.'):
+                continue
+
+            path = os.path.join(prefix, name)
+            mime = classify(name)
+
+            if kinds is None and extensions is None \
+                    or kinds is not None and mime.split('/', 1)[0] in kinds \
+                    or extensions is not None and os.path.splitext(name)[1].lower() in extensions:
+                yield MediaFile(path, mime)
+
+        if recursive:
+            # Reversed so they're popped off the stack in sorted order
+            stack.extend(os.path.join(prefix, name) for name in reversed(dirs)
+                         if not name.startswith('.') and name not in ignore)
+
+    if isinstance(snapshot, dict) or snapshot:
+        _save_snapshot(snapshot, new)
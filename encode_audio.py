@@ -7,76 +7,367 @@
      - flac         (https://xiph.org/flac/index.html)
      - qaac         (https://github.com/nu774/qaac)
      - ffmpeg       (https://www.ffmpeg.org/download.html)
+
+    By default every source is decoded once by ffmpeg,
+    and the PCM stream is piped into all enabled encoders at the same time.
+    Encoders are run through runner.py, which limits how many run at once and can time them out.
 """
 
 import argparse
-import glob
-import mimetypes
+import json
 import os
+import shutil
 import subprocess
+import sys
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import discovery
+import fileutil
+import runner
+import telemetry
 
 __author__ = "LightArrowsEXE"
 __license__ = 'MIT'
-__version__ = '1.0.8'
+__version__ = '1.1.0'
+
+
+# Sources are picked by extension: the audio and video types of Python's built-in mimetypes table, plus .mka.
+# Matroska video, FLAC, AAC and Opus are never sources (FLAC and M4A are what this script writes),
+# and .m2ts is only decoded to a WAV file.
+source_extensions = frozenset({
+    '.3g2', '.3gp', '.3gpp', '.3gpp2', '.aif', '.aifc', '.aiff', '.au', '.avi', '.m1v', '.mka', '.mov',
+    '.movie', '.mp2', '.mp3', '.mp4', '.mpa', '.mpe', '.mpeg', '.mpg', '.qt', '.ra', '.snd', '.wav', '.webm',
+})
+wav_only_extensions = frozenset({'.m2ts'})
+
+# Size of the chunks read from the decoder and copied to every encoder.
+pipe_bufsize = 1024 * 1024
+
+
+class JobManifest:
+    """
+    Records every source's fingerprint and the outputs produced from it,
+    so an interrupted batch can skip finished work when it's run again.
+    """
+    filename = '.encode_audio.json'
+
+    def __init__(self, path: str = filename) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as file:
+                self.entries: Dict[str, dict] = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def fingerprint(f) -> str:
+        st = os.stat(f)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def _entry(self, f) -> dict:
+        fingerprint = self.fingerprint(f)
+        entry = self.entries.get(f)
+        if not entry or entry['fingerprint'] != fingerprint:  # new or changed source
+            entry = self.entries[f] = {'fingerprint': fingerprint, 'outputs': {}, 'removed': False}
+        return entry
+
+    def outputs(self) -> set:
+        return {out for entry in self.entries.values() for out in entry['outputs']}
+
+    def removed(self) -> List[str]:
+        """Sources that were deleted after every output was finished."""
+        return [f for f, entry in self.entries.items() if entry['removed'] and not os.path.exists(f)]
+
+    def pending(self, f, outputs: Iterable[str]) -> List[str]:
+        with self._lock:
+            done = self._entry(f)['outputs']
+        return [out for out in outputs if not (done.get(out) == 'done' and os.path.isfile(out))]
+
+    def finished(self, f, outputs: Iterable[str]) -> bool:
+        """Whether every one of `outputs` was recorded as done for the source as it is now."""
+        with self._lock:
+            done = self._entry(f)['outputs']
+        return all(done.get(out) == 'done' for out in outputs)
+
+    def record(self, f, out: str, done: bool) -> None:
+        with self._lock:
+            self._entry(f)['outputs'][out] = 'done' if done else 'incomplete'
+            self._save()
+
+    def mark_removed(self, f) -> None:
+        with self._lock:
+            self.entries[f]['removed'] = True
+            self._save()
+
+    def _save(self) -> None:
+        fileutil.write_json(self.path, self.entries, indent=1, sort_keys=True)
+
 
+def partial_path(out: str) -> str:
+    """Name an output is written to until it's finished and renamed into place."""
+    root, ext = os.path.splitext(out)
+    return f"{root}.partial{ext}"
 
-ignored_formats = ["audio/opus", "audio/aac"]
+
+def get_jobs() -> List[Tuple[str, bool]]:
+    # Don't pick up our own outputs (finished or not) as new sources
+    produced = manifest.outputs() if manifest else set()
+
+    jobs = []
+    for m in discovery.walk(recursive=args.recursive, extensions=source_extensions | wav_only_extensions):
+        if m.path in produced or '.partial.' in os.path.basename(m.path):
+            continue
+        jobs.append((m.path, m.ext in wav_only_extensions))
+    return jobs
+
+
+def is_source(f) -> bool:
+    """Whether `f` is something get_jobs would pick up, going by its extension."""
+    return os.path.splitext(f)[1].lower() in source_extensions | wav_only_extensions
+
+
+def run_job(f, wav_only: bool) -> Dict[str, int]:
+    try:
+        return encode_main(f, wav_only)
+    except Exception as e:  # report it with the rest instead of taking down the batch
+        return {f"{f} ({type(e).__name__}: {e})": -1}
 
 
 def main():
-    filelist = (glob.glob('**/*', recursive=True)
-                if args.recursive else glob.glob('*'))
+    jobs = get_jobs()
+    results = []
 
-    for f in filelist:
-        mime = mimetypes.types_map.get(os.path.splitext(f)[-1], "")
-        if f.endswith('.m2ts'):
-            encode_main(f, wav_only=True)
-        elif mime.startswith("audio/") or mime.startswith("video/") or f.endswith('.mka'):
-            if mime not in ignored_formats:
-                encode_main(f)
+    for f in manifest.removed() if manifest else ():
+        print(f"[*] {f}, already encoded (source removed)")
 
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        try:
+            for i, ((f, _), status) in enumerate(zip(jobs, pool.map(lambda job: run_job(*job), jobs)), 1):
+                failed = {out: code for out, code in status.items() if code != 0}
+                for out, code in failed.items():
+                    print(f"[!] Encoding {out} failed (exit status {code})")
+                print(f"[{'!' if failed else '+'}] ({i}/{len(jobs)}) {f}")
+                results.append((f, failed))
+        except KeyboardInterrupt:
+            # The children are in their own process groups and never saw the Ctrl+C
+            pool.shutdown(wait=False, cancel_futures=True)
+            runner.cancel()
+            raise
 
-def encode_flac(f):
-    subprocess.run(["eac3to", f, "-log=NUL", f"{os.path.splitext(f)[0]}.flac"])
+    if not results:
+        return
 
+    print("\nSummary:")
+    for f, failed in results:
+        print(f"  {'FAILED' if failed else 'OK':<6} {f}")
+        for out, code in failed.items():
+            print(f"         {out}: exit status {code}")
 
-def encode_aac(f):
-    temp = tempfile.mkstemp(prefix=f"{os.path.splitext(f)[0]}_")
-    subprocess.run(["ffmpeg", "-i", f, "-loglevel", "panic", "-stats",
-                    f"{temp[1]}.wav"])
-    subprocess.run(["qaac", f"{temp[1]}.wav", "-V 127", "--no-delay",
-                    "-o", f"{os.path.splitext(f)[0]}.m4a"])
+    if args.proc_stats:
+        print("\nProcesses:")
+        for line in runner.summary():
+            print(f"  {line}")
 
+    if any(failed for _, failed in results):
+        sys.exit(1)
 
-def encode_opus(f):
-    subprocess.run(["ffmpeg", "-i", f, "-stats",
-                    "-c:a", "libopus", "-b:a", f"{args.bitrate}",
-                    f"{os.path.splitext(f)[0]}.opus"])
 
+def encode_flac(f, out: Optional[str] = None) -> int:
+    out = out or f"{os.path.splitext(f)[0]}.flac"
+    return runner.run(["eac3to", f, "-log=NUL", out], timeout=args.timeout)
 
-def encode_main(f, wav_only: bool = False):
-    print(f"\n{f}\n")
-    if wav_only:
-        if args.track:
-            subprocess.run(["eac3to", f, "-log=NUL", f"{args.track}:",
-                            f"{os.path.splitext(f)[0]}_Track0{args.track}.wav"])
+
+def encode_aac(f, out: Optional[str] = None) -> int:
+    out = out or f"{os.path.splitext(f)[0]}.m4a"
+    decode = ["ffmpeg", "-i", f, "-loglevel", "panic", "-stats", "-vn", "-c:a", _pcm_codec(f)]
+    qaac_args = ["-V", "127", "--no-delay", "-o", out]
+
+    if args.temp_wav:
+        # The directory (and the WAV in it) is removed even if encoding fails or is interrupted
+        with tempfile.TemporaryDirectory(prefix=".encode_audio_",
+                                         dir=os.path.dirname(os.path.abspath(f))) as temp:
+            wav = os.path.join(temp, "audio.wav")
+            if (code := runner.run([*decode, wav], timeout=args.timeout)):
+                return code
+            return runner.run(["qaac", wav, *qaac_args], timeout=args.timeout)
+
+    with runner.limiter.slots("ffmpeg", "qaac"), \
+            runner.Process([*decode, "-f", "wav", "-"], args.timeout, stdout=subprocess.PIPE) as ffmpeg, \
+            runner.Process(["qaac", "--ignorelength", *qaac_args, "-"], args.timeout, stdin=ffmpeg.stdout) as qaac:
+        ffmpeg.stdout.close()  # qaac holds the only read end, so ffmpeg sees EPIPE if it exits
+        code = qaac.wait()
+        return ffmpeg.wait() or code
+
+
+def encode_opus(f, out: Optional[str] = None) -> int:
+    out = out or f"{os.path.splitext(f)[0]}.opus"
+    return runner.run(["ffmpeg", "-y", "-i", f, "-stats",
+                       "-c:a", "libopus", "-b:a", f"{args.bitrate}",
+                       out], timeout=args.timeout)
+
+
+def _pcm_codec(f) -> str:
+    """Pick a PCM codec that keeps the bit depth of the first audio track."""
+    if not shutil.which(runner.resolve(["ffprobe"])[0]):
+        return "pcm_s24le"
+
+    _, probe = runner.output(["ffprobe", "-v", "error", "-select_streams", "a:0",
+                              "-show_entries", "stream=sample_fmt,bits_per_raw_sample",
+                              "-of", "default=noprint_wrappers=1", f], timeout=args.timeout)
+    info = dict(line.split("=", 1) for line in probe.splitlines() if "=" in line)
+
+    if info.get("bits_per_raw_sample", "N/A").isdigit():
+        return "pcm_s16le" if int(info["bits_per_raw_sample"]) <= 16 else "pcm_s24le"
+    return "pcm_s16le" if info.get("sample_fmt", "").startswith("s16") else "pcm_s24le"
+
+
+def requested_outputs(f) -> List[str]:
+    """Every output the current arguments ask for."""
+    base = os.path.splitext(f)[0]
+    outputs = []
+    if not args.noflac:
+        outputs.append(f"{base}.flac")
+    if not args.nolossy:
+        outputs.append(f"{base}.{'opus' if args.codec == 'opus' else 'm4a'}")
+    return outputs
+
+
+def encoder_commands(outputs: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Encoder command lines that read a WAV stream from stdin, keyed by output.
+    Every encoder writes to the output's partial name.
+    """
+    cmds = {}
+    for out in outputs:
+        temp = partial_path(out)
+        if out.endswith('.flac'):
+            cmds[out] = ["flac", "--silent", "--ignore-chunk-sizes", "-f", "-o", temp, "-"]
+        elif out.endswith('.opus'):
+            cmds[out] = ["ffmpeg", "-y", "-loglevel", "panic", "-f", "wav", "-i", "-",
+                         "-c:a", "libopus", "-b:a", f"{args.bitrate}", temp]
+        elif out.endswith('.m4a'):
+            cmds[out] = ["qaac", "--silent", "--ignorelength", "-V", "127", "--no-delay",
+                         "-o", temp, "-"]
+    return cmds
+
+
+def encode_pipeline(f, outputs: Iterable[str]) -> Dict[str, int]:
+    """
+    Decode the source once and feed the PCM stream to every requested encoder at once.
+    Returns the exit status of every encoder, keyed by its output file.
+    """
+    cmds = encoder_commands(outputs)
+    if not cmds:
+        return {}
+
+    decode = ["ffmpeg", "-loglevel", "panic", "-i", f, "-vn", "-sn",
+              "-map", "0:a:0", "-c:a", _pcm_codec(f), "-f", "wav", "-"]
+
+    # The decoder runs alongside every encoder, so their slots are taken together
+    with runner.limiter.slots(decode[0], *(cmd[0] for cmd in cmds.values())), \
+            runner.Process(decode, args.timeout, stdout=subprocess.PIPE) as decoder, \
+            ExitStack() as stack:
+        # If an encoder fails to start, the ones that did are killed along with the decoder
+        encoders = {out: stack.enter_context(runner.Process(cmd, args.timeout, stdin=subprocess.PIPE))
+                    for out, cmd in cmds.items()}
+        running = dict(encoders)
+
+        try:
+            while running and (chunk := decoder.stdout.read(pipe_bufsize)):
+                for out, proc in list(running.items()):
+                    try:
+                        proc.stdin.write(chunk)
+                    except BrokenPipeError:  # encoder died, keep feeding the others
+                        del running[out]
+        finally:
+            for proc in encoders.values():
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+            decoder.stdout.close()
+            if not running:
+                decoder.kill()
+
+        status = {out: proc.wait() for out, proc in encoders.items()}
+        if decoder.wait():
+            status = {out: code or decoder.returncode for out, code in status.items()}
+    return status
+
+
+def encode_sequential(f, outputs: Iterable[str]) -> Dict[str, int]:
+    """Run every requested encoder on its own, decoding the source once per encoder."""
+    encoders = {'.flac': encode_flac, '.opus': encode_opus, '.m4a': encode_aac}
+    return {out: encoders[os.path.splitext(out)[1]](f, partial_path(out)) for out in outputs}
+
+
+def finish_outputs(f, status: Dict[str, int]) -> Dict[str, int]:
+    """Move every successful output into place and discard the rest."""
+    for out, code in status.items():
+        temp = partial_path(out)
+        if code == 0 and os.path.isfile(temp) and os.path.getsize(temp) > 0:
+            os.replace(temp, out)
         else:
-            subprocess.run(["eac3to", f, "-log=NUL",
-                            f"{os.path.splitext(f)[0]}.wav"])
+            if os.path.exists(temp):
+                os.remove(temp)
+            status[out] = code or -1  # "succeeded" without writing anything
+        if manifest:
+            manifest.record(f, out, status[out] == 0)
+    return status
+
+
+def encode_main(f, wav_only: bool = False) -> Dict[str, int]:
+    """Encode a single source, returning the exit status of every output it produced."""
+    if wav_only:
+        suffix = f"_Track0{args.track}" if args.track else ""
+        requested = [f"{os.path.splitext(f)[0]}{suffix}.wav"]
     else:
-        if not args.noflac:
-            encode_flac(f)
-        if not args.nolossy:
-            if args.codec == 'opus':
-                encode_opus(f)
-            elif args.codec == 'aac':
-                encode_aac(f)
-        if not args.keep:
-            os.remove(f)
+        requested = requested_outputs(f)
 
+    with runner.collect() as usages, \
+            telemetry.measure("encode_audio", f, __version__, bytes=os.path.getsize(f), children=usages) as event:
+        outputs = manifest.pending(f, requested) if manifest else requested
+        if manifest:
+            event['cache'] = 'miss' if outputs else 'hit'
 
-if __name__ == "__main__":
+        if not outputs:
+            event['bytes'] = None
+            print(f"[*] {f}, outputs already finished")
+        else:
+            if args.jobs == 1:
+                print(f"\n{f}\n")
+
+            if wav_only:
+                track = [f"{args.track}:"] if args.track else []
+                code = runner.run(["eac3to", f, "-log=NUL", *track, partial_path(outputs[0])], timeout=args.timeout)
+                status = finish_outputs(f, {outputs[0]: code})
+            else:
+                status = encode_sequential(f, outputs) if args.sequential else encode_pipeline(f, outputs)
+                finish_outputs(f, status)
+
+            if any(status.values()):
+                event['status'] = 'failed'
+            if wav_only or any(status.values()):
+                return status
+
+    # Only remove the source once every requested output exists and was recorded as done,
+    # and never when the source is one of its own outputs
+    if not wav_only and not args.keep \
+            and os.path.abspath(f) not in {os.path.abspath(out) for out in requested} \
+            and all(os.path.isfile(out) for out in requested) \
+            and (not manifest or manifest.finished(f, requested)):
+        os.remove(f)
+        if manifest:
+            manifest.mark_removed(f)
+    return {}
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument("-R", "--recursive",
                         action="store_true", default=False,
@@ -100,7 +391,56 @@ if __name__ == "__main__":
     parser.add_argument("-N", "--nolossy",
                         action="store_true", default=False,
                         help="Disable lossy encoding (default: %(default)s)")
-    parser.parse_args()
+    parser.add_argument("-S", "--sequential",
+                        action="store_true", default=False,
+                        help="Decode the source separately for every encoder, using eac3to for FLAC (default: %(default)s)")
+    parser.add_argument("--temp-wav",
+                        action="store_true", default=False,
+                        help="Decode to a temporary WAV file for qaac instead of piping (only with --sequential) (default: %(default)s)")
+    parser.add_argument("-J", "--jobs",
+                        action="store", type=int, default=1,
+                        help="Number of files to encode at the same time (default: %(default)s)")
+    parser.add_argument("--max-procs",
+                        action="store", type=int, default=os.cpu_count() or 1,
+                        help="Maximum number of encoder processes alive at once (default: %(default)s)")
+    parser.add_argument("--tool-limits",
+                        action="store", default="",
+                        help="Maximum number of processes alive at once per tool, like 'eac3to=2,qaac=8' (default: none)")
+    parser.add_argument("--timeout",
+                        action="store", type=float, default=None,
+                        help="Kill any encoder that runs for longer than this many seconds (default: %(default)s)")
+    parser.add_argument("--proc-stats",
+                        action="store_true", default=False,
+                        help="Print wall time, CPU time and peak memory per tool at the end (default: %(default)s)")
+    parser.add_argument("--no-manifest",
+                        action="store_true", default=False,
+                        help="Do not record progress, and encode every output again (default: %(default)s)")
+    parser.add_argument("--telemetry",
+                        action="store", default=None, metavar="LOG",
+                        help="Append an event per encoded file to this JSON-lines log (default: %(default)s)")
+
+    return parser
+
+
+def check_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Reject invalid combinations through `parser`, and set up the runner for the rest."""
+    if args.jobs < 1 or args.max_procs < 1:
+        parser.error("--jobs and --max-procs must be at least 1")
+    if args.temp_wav and not args.sequential:
+        parser.error("--temp-wav only works together with --sequential")
+
+    try:
+        runner.configure(args.max_procs, runner.parse_limits(args.tool_limits))
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    parser = build_parser()
     args = parser.parse_args()
 
+    check_args(parser, args)
+    telemetry.configure(args.telemetry)
+    manifest = None if args.no_manifest else JobManifest()
+
     main()
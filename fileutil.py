@@ -0,0 +1,39 @@
+"""
+    File helpers shared by the scripts in this repository.
+
+    Caches, manifests, registries and reports are all written through `write_atomic`:
+    the data goes to a temporary file next to the target, which is then renamed over it,
+    so an interrupted run never leaves a half-written file behind.
+"""
+import json
+import os
+import threading
+from typing import Any, Union
+
+__author__ = "LightArrowsEXE"
+__license__ = 'MIT'
+__version__ = '1.0'
+
+
+def write_atomic(path: Union[str, os.PathLike], data: Union[str, bytes]) -> None:
+    """Write `data` (text is encoded as UTF-8, newlines as-is) to a temporary file and rename it into place."""
+    path = os.fspath(path)
+    # Unique per process and thread, so concurrent writers never share a temporary file
+    temp = os.path.join(os.path.dirname(path),
+                        f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    try:
+        with open(temp, 'wb') as file:
+            file.write(data.encode('utf-8') if isinstance(data, str) else data)
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_json(path: Union[str, os.PathLike], obj: Any, **kwargs) -> None:
+    """Write `obj` as JSON through `write_atomic`. Keyword arguments go to json.dumps."""
+    write_atomic(path, json.dumps(obj, **kwargs))
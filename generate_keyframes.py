@@ -11,30 +11,59 @@ Dependencies:
     * colorlog (https://github.com/borntyping/python-colorlog) (optional for colored logging)
 """
 
+from __future__ import annotations
+
 import argparse
+import glob
+import hashlib
+import json
 import logging
+import logging.handlers
+import multiprocessing
+import os
+import time
 from ast import literal_eval
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Tuple
 import pprint
 
-from vssource import BestSource, FFMS2
-from vstools import FileType, Keyframes, SceneChangeMode, SPath, core, vs
-
 import sys
 
-try:
-    from colorlog import ColoredFormatter
+import discovery
+import fileutil
+import keyframe_writer
+import telemetry
 
-    _colorlog_available = True
-except ImportError:
-    _colorlog_available = False
+if TYPE_CHECKING:
+    from vstools import Keyframes, SceneChangeMode, vs
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 __author__ = "LightArrowsEXE"
 __license__ = "MIT"
-__version__ = "2.0"
+__version__ = "2.1"
 
 logger = logging.getLogger("generate_keyframes")
 
-if _colorlog_available:
+
+def setup_logging() -> None:
+    """Log through colorlog if it's installed, and plain logging otherwise."""
+
+    try:
+        from colorlog import ColoredFormatter
+    except ImportError:
+        logging.basicConfig(
+            level=logging.INFO,
+            format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        )
+        return
+
     handler = logging.StreamHandler(sys.stdout)
     formatter = ColoredFormatter(
         "%(log_color)s%(asctime)s %(levelname)s %(name)s: %(message)s",
@@ -50,53 +79,270 @@ if _colorlog_available:
     logger.handlers = []
     logger.addHandler(handler)
     logger.setLevel(logging.INFO)
-else:
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
-    )
 
 
-def generate_keyframes(clip: vs.VideoNode, out_path: SPath, header: bool) -> None:
+def load_vapoursynth() -> None:
+    """
+    Import VapourSynth and the source filters, and set up the core, the first time a file needs them.
+
+    Loading them (and every plugin with them) takes a while, and nothing that only deals with paths needs them,
+    so --help, argument errors and runs where every file is skipped never pay for it.
+    """
+
+    global BestSource, FFMS2, Keyframes, SceneChangeMode, core, vs
+
+    if "vs" in globals():
+        return
+
+    from vssource import BestSource, FFMS2
+    from vstools import Keyframes, SceneChangeMode, core, vs
+
+    configure_core(args)
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process so far, in MB."""
+
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports KiB, macOS reports bytes
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+class FileStats:
+    """Wall time, throughput and peak memory of every phase of processing a single file."""
+
+    def __init__(self, file: Path) -> None:
+        self.file = str(file)
+        self.phases: dict[str, dict] = {}
+        # The keyframes that were written and the frame count they're for, kept for the season index
+        self.keyframes: tuple[list[int], int] | None = None
+        # Whether the keyframe cache (or existing output) saved running detection, and how many frames it decoded
+        self.cache: str | None = None
+        self.frames: int | None = None
+
+    @contextmanager
+    def phase(self, name: str, frames: int | None = None):
+        """Time a phase. The body can set `frames` on the yielded dict once it knows the frame count."""
+
+        record = {"frames": frames}
+        start = time.perf_counter()
+
+        try:
+            yield record
+        finally:
+            elapsed = time.perf_counter() - start
+            frames = record["frames"]
+
+            self.phases[name] = {
+                "seconds": round(elapsed, 4),
+                "frames": frames,
+                "fps": round(frames / elapsed, 2) if frames and elapsed else None,
+                "peak_rss_mb": peak_rss_mb(),
+            }
+
+    def as_dict(self) -> dict:
+        return {"file": self.file, "phases": self.phases}
+
+
+def segment_bounds(num_frames: int, segments: int) -> list[tuple[int, int]]:
+    """Split a clip into `segments` contiguous [start, end) frame ranges."""
+
+    bounds = [round(i * num_frames / segments) for i in range(segments + 1)]
+
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def detect_keyframes(
+    clip: vs.VideoNode, mode: SceneChangeMode, segments: int = 1, overlap: int = 0
+) -> Keyframes:
+    """
+    Detect keyframes, optionally splitting the clip into segments that are scanned concurrently.
+
+    Every segment starts `overlap` frames early so the detectors have the history they would have had
+    in a sequential pass. Keyframes found in that lead-in belong to the previous segment and are dropped,
+    as is the forced keyframe on a segment's first frame, which is why `overlap` has to be at least 1.
+    """
+
+    if segments > 1 and overlap < 1:
+        raise ValueError(f"segments need at least 1 frame of overlap, got {overlap}")
+
+    if segments <= 1 or clip.num_frames < 2 * segments * max(overlap, 1):
+        return Keyframes.from_clip(clip, mode=mode)
+
+    def scan(bounds: tuple[int, int]) -> list[int]:
+        start, end = bounds
+        lead_in = max(0, start - overlap)
+
+        found = Keyframes.from_clip(clip[lead_in:end], mode=mode)
+
+        return [f + lead_in for f in found if start <= f + lead_in < end]
+
+    ranges = segment_bounds(clip.num_frames, segments)
+    logger.debug(f"Scanning {len(ranges)} segments with {overlap} frames of overlap: {ranges}")
+
+    # VapourSynth renders frames without holding the GIL, so threads are enough here.
+    with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+        found = sorted(set(f for frames in pool.map(scan, ranges) for f in frames))
+
+    return Keyframes(found)
+
+
+def generate_keyframes(clip: vs.VideoNode) -> Keyframes:
     """Generate keyframes for a given clip."""
 
-    logger.debug(f"Generating keyframes: out_path={out_path}, header={header}")
+    mode = SceneChangeMode(args.scene_mode)
+    scenes = detect_keyframes(clip, mode, args.segments, args.segment_overlap)
+
+    if args.check_segments and args.segments > 1:
+        if (sequential := Keyframes.from_clip(clip, mode=mode)) != scenes:
+            missing, extra = sorted(set(sequential) - set(scenes)), sorted(set(scenes) - set(sequential))
+            logger.warning(
+                f"Segmented keyframes differ from a sequential run (missing: {missing}, extra: {extra}). "
+                "Writing the sequential result; consider raising --segment-overlap."
+            )
+            scenes = sequential
+        else:
+            logger.info("Segmented keyframes match a sequential run.")
+
+    return scenes
+
+
+def default_cache_dir() -> Path:
+    """Per-user cache directory for keyframe lists."""
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.environ.get("LOCALAPPDATA") or Path.home() / ".cache"
+
+    return Path(base) / "generate_keyframes"
+
+
+def source_fingerprint(f: Path, sample_size: int = 1 << 20) -> str:
+    """
+    Content fingerprint of a source: its size plus a hash of samples from the start, middle and end.
+    Renaming or copying a file keeps its fingerprint, while re-encoding or re-muxing changes it.
+    """
+
+    size = f.stat().st_size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+
+    with open(f, "rb") as file:
+        for offset in sorted({0, max(0, size // 2 - sample_size // 2), max(0, size - sample_size)}):
+            file.seek(offset)
+            digest.update(file.read(sample_size))
+
+    return digest.hexdigest()
+
+
+def keyframe_cache_path(fingerprint: str, args: argparse.Namespace) -> Path:
+    """Cache entry for the untrimmed keyframes of a source under the current detection settings."""
+
+    source_filter = "ffms2" if args.fast else "bestsource"
+
+    return Path(args.cache_dir) / f"{fingerprint}_{args.scene_mode}_{source_filter}.json"
+
+
+def index_cache_path(fingerprint: str, args: argparse.Namespace) -> Path:
+    """
+    Index location for a source in the managed index cache.
+
+    FFMS2 writes exactly this file. For BestSource it's a prefix without an extension:
+    it writes one `<prefix>.<track>.bsindex` file per track it indexes.
+    """
+
+    index_dir = Path(args.cache_dir) / "index"
+
+    return index_dir / f"{fingerprint}.ffindex" if args.fast else index_dir / fingerprint
+
+
+def index_files(index_path: Path) -> list[Path]:
+    """The index files that actually exist for an `index_cache_path`."""
+
+    if index_path.suffix == ".ffindex":
+        return [index_path] if index_path.exists() else []
+
+    return sorted(index_path.parent.glob(f"{glob.escape(index_path.name)}.*.bsindex"))
+
+
+def load_cached_keyframes(path: Path) -> tuple[list[int], int] | None:
+    """Load cached keyframes and the frame count of the clip they came from."""
 
-    scenes = Keyframes.from_clip(clip, mode=SceneChangeMode(args.scene_mode))
-    scenes.to_file(out_path, header=header, force=args.force)
+    try:
+        data = json.loads(path.read_text())
+        return list(data["keyframes"]), data["num_frames"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def store_cached_keyframes(path: Path, keyframes: Keyframes, num_frames: int) -> None:
+    """Write a cache entry atomically."""
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fileutil.write_json(path, {"num_frames": num_frames, "keyframes": list(keyframes)})
+
+
+def evict_index_files(index_dir: Path, max_size_mb: int) -> None:
+    """
+    Remove the indexes of the least recently used sources until the index cache fits in `max_size_mb`.
+
+    All index files of a source (BestSource writes one per track) are evicted together.
+    """
+
+    if not index_dir.is_dir():
+        return
 
-    logger.debug(f"Keyframes written to {out_path}")
+    sources: dict[str, list] = {}
 
+    for f in index_dir.iterdir():
+        if f.suffix not in (".ffindex", ".bsindex"):
+            continue
 
-def clean_index_files(file: SPath) -> None:
-    """Clean index files from a given file."""
+        try:
+            st = f.stat()
+        except FileNotFoundError:  # evicted by another worker
+            continue
 
-    logger.debug(f"Cleaning index files: {file}")
+        entry = sources.setdefault(f.name.split(".")[0], [0.0, 0, []])
+        entry[0] = max(entry[0], st.st_mtime)
+        entry[1] += st.st_size
+        entry[2].append(f)
 
-    idx_file = "ffindex" if args.fast else "[0-9].bsindex"
+    total = sum(size for _, size, _ in sources.values())
+    limit = max_size_mb * 1024 * 1024
 
-    for f in file.glob(f"*.{idx_file}"):
-        logger.debug(f"Removing index file: {f}")
+    for _, size, files in sorted(sources.values(), key=lambda e: e[0]):
+        if total <= limit:
+            break
 
-        f.unlink(missing_ok=True)
+        for f in files:
+            logger.debug(f"Evicting index file: {f}")
+
+            f.unlink(missing_ok=True)
+
+        total -= size
 
 
 def get_files(args: argparse.Namespace) -> list:
-    """Get list of files to process based on args."""
+    """Get list of files to process based on args. Only files with a video extension are picked up."""
 
     if args.file:
-        return [SPath(args.file)]
+        return [Path(args.file)]
+
+    cwd = Path.cwd()
 
-    return list(SPath.cwd().glob("**/*" if args.recursive else "*"))
+    return [cwd / m.path for m in discovery.walk(recursive=args.recursive, kinds={"video"})]
 
 
-def is_video_file(f: SPath) -> bool:
-    """Check if file is a video file."""
+def is_video_file(f: Path) -> bool:
+    """Check if file is a video file, going by its extension."""
 
-    return FileType.parse(f).file_type is FileType.VIDEO
+    return discovery.classify(str(f)).startswith("video/")
 
 
-def keyframes_exist(f: SPath) -> bool:
+def keyframes_exist(f: Path) -> bool:
     """Check if keyframe file already exists and should be skipped."""
 
     logger.debug(f"Checking if keyframe file exists: {f}")
@@ -104,51 +350,154 @@ def keyframes_exist(f: SPath) -> bool:
     return f.exists()
 
 
-def get_source_and_info(f: SPath, ftype) -> tuple:
-    """Get video source and info lines."""
+def get_source_and_info(f: Path, index_path: Path | None = None) -> tuple:
+    """Get video source and info lines, reading and writing the index at `index_path` if given."""
+
+    kwargs = {}
+
+    if index_path:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+
+        for existing in index_files(index_path):
+            logger.debug(f"Reusing index file: {existing}")
+            existing.touch()  # mark it as recently used
+
+        kwargs = {"cachefile": str(index_path)} if args.fast else {"cachemode": 4, "cachepath": str(index_path)}
 
     if args.fast:
-        src = FFMS2.source(f, bits=0)
+        src = FFMS2.source(f, bits=0, **kwargs)
     else:
-        src = BestSource.source(f, bits=0)
+        src = BestSource.source(f, bits=0, **kwargs)
 
     info_lines = [
         "Video info",
         f"Filename: {f}",
         f"Dimensions: {src.width}x{src.height} ({src.format.name if src.format else 'Unknown'}) @ {src.fps} fps",
-        f"Mimetype: {ftype.mime}",
+        f"Mimetype: {discovery.classify(str(f))}",
         "",
     ]
     logger.debug("\n" + "\n".join(info_lines))
     return src, info_lines
 
 
-def apply_trims(src: vs.VideoNode, trims_arg: str) -> vs.VideoNode:
-    """Apply trims to the source if specified."""
+trims_example = 'Example: -T "[24,-24]" , -T "[None,30000],[30024,-24]", -T "[None,16000],[16100,16200],[16300,None]"'
 
-    logger.debug(f"Trims argument: {trims_arg}")
-    trims = literal_eval(trims_arg)
+Trim = Tuple[Optional[int], Optional[int]]
 
-    if type(trims) is not tuple:
-        trims = (trims,)
+
+def parse_trims(trims_arg: str) -> list[Trim]:
+    """
+    Parse the --trims argument into (start, end) pairs, with the same meaning as the clip slices they stand for.
+    Used as the argparse type, so malformed trims are rejected before any file is touched.
+    """
 
     try:
-        logger.debug(f"Applying trims: {trims}")
-        src = core.std.Splice([src[slice(*trim)] for trim in trims])
-    except (vs.Error, TypeError) as e:
-        logger.error(
-            "TypeError: Please make sure you're using a list for this function.\n"
-            'Example: -T "[24,-24]" , -T "[None,30000],[None,-24]", -T "[None,16000],[16100,16200],[16300,None]"'
+        trims = literal_eval(trims_arg)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        trims = None
+
+    if isinstance(trims, list):
+        trims = (trims,)
+
+    if type(trims) is not tuple or not trims or not all(
+        isinstance(trim, (list, tuple)) and len(trim) == 2
+        and all(bound is None or type(bound) is int for bound in trim)
+        for trim in trims
+    ):
+        raise argparse.ArgumentTypeError(
+            f"invalid trims {trims_arg!r}: expected one or more [start,end] pairs of integers or None. {trims_example}"
         )
 
-        logger.debug(f"Error: {e}")
+    return [tuple(trim) for trim in trims]
+
+
+class TrimPlan:
+    """
+    Trims resolved against a clip's frame count.
+
+    None and negative bounds are resolved exactly like slicing a clip would,
+    and every trim has to select at least one frame and come after the one before it.
+    The plan maps frame numbers between the source and the trimmed timeline in both directions,
+    so the same untrimmed keyframes can be remapped any number of times.
+    """
+
+    def __init__(self, trims: list[Trim], num_frames: int) -> None:
+        self.trims = trims
+        self.source_frames = num_frames
+        self.ranges: list[range] = []
+        self.offsets: list[int] = []  # first frame of every trim on the trimmed timeline
+
+        offset = 0
+
+        for start, end in trims:
+            if any(bound is not None and not -num_frames <= bound <= num_frames for bound in (start, end)):
+                raise ValueError(f"trim [{start},{end}] is outside of the clip ({num_frames} frames)")
+
+            r = range(num_frames)[start:end]
+
+            if not r:
+                raise ValueError(f"trim [{start},{end}] doesn't select any frames ({num_frames} frames)")
+
+            if self.ranges and r.start < self.ranges[-1].stop:
+                raise ValueError(f"trim [{start},{end}] overlaps or comes before the trim before it")
+
+            self.ranges.append(r)
+            self.offsets.append(offset)
+            offset += len(r)
+
+        self.num_frames = offset
+        self._starts = [r.start for r in self.ranges]
+
+    def __repr__(self) -> str:
+        ranges = ", ".join(f"[{r.start},{r.stop})" for r in self.ranges)
+        return f"TrimPlan({ranges} of {self.source_frames} -> {self.num_frames} frames)"
+
+    def to_trimmed(self, frame: int) -> int | None:
+        """Frame number on the trimmed timeline of a source frame, or None if it's trimmed away."""
+
+        i = bisect_right(self._starts, frame) - 1
+
+        if i < 0 or frame >= self.ranges[i].stop:
+            return None
 
-        return  # type: ignore
+        return self.offsets[i] + frame - self.ranges[i].start
 
-    return src
+    def to_source(self, frame: int) -> int:
+        """Source frame number of a frame on the trimmed timeline."""
 
+        if not 0 <= frame < self.num_frames:
+            raise IndexError(f"frame {frame} is outside of the trimmed clip ({self.num_frames} frames)")
 
-def get_output_path(f: SPath, args: argparse.Namespace) -> SPath:
+        i = bisect_right(self.offsets, frame) - 1
+
+        return self.ranges[i].start + frame - self.offsets[i]
+
+    def remap(self, keyframes: list[int]) -> list[int]:
+        """
+        Remap sorted keyframes of the source onto the trimmed timeline.
+
+        This gives the same frame numbers as splicing the trimmed clips together,
+        with the first frame of every trim marked as a keyframe.
+        """
+
+        remapped = []
+
+        for r, offset in zip(self.ranges, self.offsets):
+            inside = keyframes[bisect_right(keyframes, r.start):bisect_left(keyframes, r.stop)]
+            remapped += [offset] + [f - r.start + offset for f in inside]
+
+        return remapped
+
+
+def apply_trims(keyframes: list[int], plan: TrimPlan) -> list[int]:
+    """Remap keyframes of the untrimmed source onto the timeline the trims produce."""
+
+    logger.debug(f"Applying trims: {plan}")
+
+    return plan.remap(sorted(keyframes))
+
+
+def get_output_path(f: Path, args: argparse.Namespace) -> Path:
     """Determine output path for keyframes file."""
 
     if args.outfile:
@@ -157,31 +506,316 @@ def get_output_path(f: SPath, args: argparse.Namespace) -> SPath:
     return f.with_name(f.stem + "_keyframes.txt")
 
 
-def process_file(f: SPath, args: argparse.Namespace):
-    logger.debug(f"Processing file: {f}")
-
-    if (ftype := FileType.parse(f)).file_type is not FileType.VIDEO:
-        logger.info(f"{f} is not a video file. Skipping.")
-        return
+def get_output_paths(f: Path, args: argparse.Namespace) -> dict[str, Path]:
+    """Output path of every requested format. The Aegisub file keeps the exact name `get_output_path` gives."""
 
     out_path = get_output_path(f, args)
+    paths = keyframe_writer.output_paths(out_path.with_suffix(""), args.formats)
+
+    if "aegisub" in paths:
+        paths["aegisub"] = out_path
+
+    return paths
+
+
+def read_written_keyframes(paths: dict[str, Path]) -> tuple[list[int], int] | None:
+    """Read keyframes back from earlier output, preferring formats that record the frame count."""
+
+    for name in ("json", "xvid", "aegisub", "plain"):
+        if name in paths and paths[name].exists():
+            keyframes, num_frames = keyframe_writer.read_keyframes(paths[name])
+            return keyframes, num_frames if num_frames is not None else 0
+
+    return None
+
+
+def process_file(f: Path, args: argparse.Namespace, stats: FileStats | None = None) -> Path | None:
+    """Generate keyframes for a single file, returning the output path if any were written."""
+
+    stats = stats or FileStats(f)
+
+    with telemetry.measure("generate_keyframes", f, __version__) as event:
+        out_path = _process_file(f, args, stats)
+        event.update(cache=stats.cache, frames=stats.frames, bytes=f.stat().st_size if stats.frames else None)
+
+    return out_path
+
+
+def _process_file(f: Path, args: argparse.Namespace, stats: FileStats) -> Path | None:
+    """Does the work of `process_file`, noting on `stats` what it had to decode."""
+
+    logger.debug(f"Processing file: {f}")
+
+    out_paths = get_output_paths(f, args)
+    out_path = next(iter(out_paths.values()))
 
     if args.check_exists and not args.force:
-        if keyframes_exist(out_path):
+        if all(keyframes_exist(path) for path in out_paths.values()):
             logger.info(f"Keyframes already exist for {f}. Skipping.")
+            stats.cache = "hit"
             return
 
-    logger.debug(f"Indexing video: {f}")
-    src, _ = get_source_and_info(f, ftype)
+    if not is_video_file(f):
+        logger.info(f"{f} is not a video file. Skipping.")
+        return
+
+    with stats.phase("cache_lookup"):
+        fingerprint = source_fingerprint(f)
+        cache_path = keyframe_cache_path(fingerprint, args)
+        cached = None if args.no_cache else load_cached_keyframes(cache_path)
+        stats.cache = None if args.no_cache else "hit" if cached else "miss"
+
+    if cached:
+        logger.debug(f"Using cached keyframes: {cache_path}")
+        keyframes, num_frames = cached
+    else:
+        logger.debug(f"Indexing video: {f}")
+
+        load_vapoursynth()
+
+        index_path = index_cache_path(fingerprint, args) if args.index_cache_size else None
+
+        with stats.phase("get_source_and_info") as phase:
+            src, _ = get_source_and_info(f, index_path)
+            phase["frames"] = num_frames = src.num_frames
+
+        if index_path:
+            evict_index_files(index_path.parent, args.index_cache_size)
+
+    # Trims are checked against the frame count before scene change detection decodes anything
+    plan = None
 
     if args.trims:
-        if (src := apply_trims(src, args.trims)) is None:
+        try:
+            plan = TrimPlan(args.trims, num_frames)
+        except ValueError as e:
+            logger.error(f"Invalid trims for {f}: {e}")
             return
 
-    logger.debug(f"Output path: {out_path}")
+    if not cached:
+        with stats.phase("from_clip", num_frames):
+            keyframes = generate_keyframes(src)
+
+        stats.frames = num_frames
+
+        if not args.no_cache:
+            store_cached_keyframes(cache_path, keyframes, num_frames)
+
+    if plan:
+        with stats.phase("apply_trims", num_frames):
+            keyframes = apply_trims(keyframes, plan)
+
+    logger.debug(f"Output paths: {', '.join(map(str, out_paths.values()))}")
+
+    # Every format is rendered from the same list, so detection never runs again for another format
+    with stats.phase("to_file"):
+        num_frames = plan.num_frames if plan else num_frames
+        written = keyframe_writer.write_keyframes(
+            out_paths, keyframes, num_frames, header=args.header, force=args.force
+        )
+
+    stats.keyframes = sorted(keyframes), num_frames
+
+    for path in out_paths.values():
+        if path in written:
+            logger.info(f"Output: {path}")
+        else:
+            logger.info(f"{path} already exists, use --force (-f) to overwrite it")
+
+    return out_path
+
+
+def configure_core(args: argparse.Namespace) -> None:
+    """Apply the per-process VapourSynth thread count and cache size."""
+
+    if args.vs_threads:
+        core.num_threads = args.vs_threads
+
+    if args.vs_cache:
+        core.max_cache_size = args.vs_cache
+
+
+def init_worker(worker_args: argparse.Namespace, log_queue) -> None:
+    """Set up a worker process to log through the parent. Its core is set up once it first needs one."""
+
+    global args
+    args = worker_args
+
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logger.propagate = False
+    logger.setLevel(getattr(logging, args.log_level))
+
+
+def timed_process_file(f: Path) -> tuple[Path, float, str, dict, tuple[list[int], int] | None]:
+    """
+    Run `process_file`, returning the file, its wall time, its status, its per-phase stats
+    and the keyframes it wrote (with their frame count).
+    """
+
+    stats = FileStats(f)
+    start = time.perf_counter()
+
+    try:
+        status = "done" if process_file(f, args, stats) else "skipped"
+    except Exception as e:
+        logger.error(f"Failed to process {f}: {e}")
+        status = "FAILED"
+
+    return f, time.perf_counter() - start, status, stats.as_dict(), stats.keyframes
+
+
+def process_files(files: list[Path], args: argparse.Namespace) -> list[tuple]:
+    """Process every file, spreading them over `args.jobs` worker processes."""
+
+    if args.jobs == 1:
+        return [timed_process_file(f) for f in files]
+
+    # Workers hand their log records to the parent, so lines from different files never interleave.
+    with multiprocessing.Manager() as manager:
+        log_queue = manager.Queue()
+        listener = logging.handlers.QueueListener(
+            log_queue, *(logger.handlers or logging.getLogger().handlers), respect_handler_level=True
+        )
+        listener.start()
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=args.jobs, initializer=init_worker, initargs=(args, log_queue)
+            ) as pool:
+                return list(pool.map(timed_process_file, files))
+        finally:
+            listener.stop()
+
+
+def log_summary(results: list[tuple], profile: bool = False) -> None:
+    """Log the time every file took, and with `profile` the time every phase took."""
+
+    processed = [r for r in results if r[2] != "skipped"]
+
+    if not processed:
+        return
+
+    logger.info("Summary:")
+
+    for f, elapsed, status, stats, _ in processed:
+        logger.info(f"  {elapsed:8.2f}s  {status:<6}  {f.name}")
+
+        if not profile:
+            continue
+
+        for name, phase in stats["phases"].items():
+            fps = f"{phase['fps']:10.2f} fps" if phase["fps"] else " " * 14
+            rss = f"{phase['peak_rss_mb']:8.1f} MB peak RSS" if phase["peak_rss_mb"] else ""
+            logger.info(f"      {phase['seconds']:8.3f}s  {name:<20} {fps}  {rss}")
+
+    logger.info(f"  {sum(r[1] for r in processed):8.2f}s  total processing time")
+
+    if skipped := len(results) - len(processed):
+        logger.info(f"  ({skipped} files skipped)")
+
+
+def write_stats(results: list[tuple], path: str) -> None:
+    """Write per-file and per-phase stats as JSON."""
+
+    data = [
+        {**stats, "status": status, "seconds": round(elapsed, 4)}
+        for _, elapsed, status, stats, _ in results
+        if status != "skipped"
+    ]
+
+    Path(path).write_text(json.dumps(data, indent=2))
+    logger.info(f"Stats written to {path}")
+
+
+def synthetic_clip(scenes: int = 48, scene_length: int = 120, noise: bool = True) -> vs.VideoNode:
+    """A clip of flat scenes with hard cuts between them, with grain on top if the grain plugin is available."""
+
+    clips = [
+        core.std.BlankClip(
+            format=vs.YUV420P8, width=1920, height=1080, length=scene_length,
+            color=[(i * 37) % 220 + 16, (i * 53) % 224 + 16, (i * 71) % 224 + 16],
+        )
+        for i in range(scenes)
+    ]
+
+    clip = core.std.Splice(clips)
+
+    if noise and hasattr(core, "grain"):
+        clip = core.grain.Add(clip, var=8.0, constant=False)
+
+    return clip
+
+
+def benchmark(args: argparse.Namespace) -> None:
+    """
+    Time every scene change mode on a synthetic clip with known cuts,
+    and both source filters on `--file` if it's given.
+    """
+
+    load_vapoursynth()
+
+    scenes = 48
+    clip = synthetic_clip(scenes)
+
+    logger.info(f"Synthetic clip: {clip.num_frames} frames, {scenes} scenes")
+
+    for mode in SceneChangeMode:
+        start = time.perf_counter()
+
+        try:
+            found = Keyframes.from_clip(clip, mode=mode)
+        except (vs.Error, AttributeError) as e:  # missing wwxd/scxvid plugin
+            logger.warning(f"  {mode.name:<26} unavailable: {e}")
+            continue
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"  {mode.name:<26} {elapsed:8.2f}s  {clip.num_frames / elapsed:10.2f} fps  {len(found)}/{scenes} keyframes")
+
+    if not args.file:
+        return
+
+    for name, source in (("BestSource", BestSource), ("FFMS2", FFMS2)):
+        start = time.perf_counter()
+        src = source.source(args.file, bits=0)
+        indexed = time.perf_counter() - start
+
+        for frame in src.frames(close=True):
+            pass
+
+        decoded = time.perf_counter() - start - indexed
+        logger.info(f"  {name:<26} index {indexed:8.2f}s  decode {src.num_frames / decoded:10.2f} fps")
+
+
+def write_season_index(results: list[tuple], args: argparse.Namespace) -> None:
+    """Write one index with the keyframes of every file, reading back earlier output for skipped files."""
+
+    episodes = {}
 
-    generate_keyframes(src, out_path, args.header)
-    logger.info(f"Output: {out_path}")
+    for f, _, _, _, written in results:
+        if written is None:
+            written = read_written_keyframes(get_output_paths(f, args))
+
+        if written is None:
+            logger.warning(f"No keyframes for {f}, leaving it out of the season index")
+            continue
+
+        # Keyed by the path relative to the working directory, so S1/01.mkv and S2/01.mkv don't collide
+        try:
+            name = Path(os.path.relpath(f)).as_posix()
+        except ValueError:  # on another drive
+            name = Path(f).as_posix()
+
+        episodes[name] = written
+
+    keyframe_writer.write_season_index(Path(args.season_index), episodes)
+    logger.info(f"Season index with {len(episodes)} files written to {args.season_index}")
+
+
+def formats_type(formats_arg: str) -> list[str]:
+    try:
+        return keyframe_writer.parse_formats(formats_arg)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
 
 def set_fast_scene_change_detection(args: argparse.Namespace) -> argparse.Namespace:
@@ -194,7 +828,7 @@ def set_fast_scene_change_detection(args: argparse.Namespace) -> argparse.Namesp
     return args
 
 
-if __name__ == "__main__":
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-F", "--file", help="generate keyframes for a specific file", action="store"
@@ -246,6 +880,7 @@ if __name__ == "__main__":
         "-T",
         "--trims",
         action="store",
+        type=parse_trims,
         help="string of trims to source file. "
         'format: "[inclusive,exclusive],[inclusive,exclusive],[None,exclusive],[inclusive,None]"',
     )
@@ -263,6 +898,109 @@ if __name__ == "__main__":
         default=False,
         help="Force overwrite keyframes file if it already exists (default: %(default)s)",
     )
+    parser.add_argument(
+        "-J",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of files to process at the same time, each in its own process (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--vs-threads",
+        type=int,
+        default=0,
+        help="VapourSynth threads per worker, 0 keeps VapourSynth's default (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--vs-cache",
+        type=int,
+        default=0,
+        help="VapourSynth cache size in MB per worker, 0 keeps VapourSynth's default (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=1,
+        help="split every clip into this many frame ranges that are scanned concurrently (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--segment-overlap",
+        type=int,
+        default=250,
+        help="frames every segment starts early so detection matches a sequential run, at least 1 "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--check-segments",
+        action="store_true",
+        default=False,
+        help="also run a sequential scan and compare it against the segmented result (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=default_cache_dir(),
+        help="directory keyframes of untrimmed sources are cached in (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--index-cache-size",
+        type=int,
+        default=8192,
+        metavar="MB",
+        help="size of the index cache in the cache directory. Least recently used indexes are evicted first. "
+        "0 leaves indexing to the source filter (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="always run scene detection, and don't cache the result (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="log the wall time, fps and peak memory of every phase (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stats-json",
+        action="store",
+        default=None,
+        metavar="PATH",
+        help="write per-file and per-phase stats to a JSON file (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--formats",
+        action="store",
+        type=formats_type,
+        default="aegisub",
+        metavar="FORMATS",
+        help=(
+            "comma-separated keyframe formats to write, all from a single detection pass: "
+            f"{', '.join(keyframe_writer.formats)} (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "--season-index",
+        action="store",
+        default=None,
+        metavar="PATH",
+        help="also write the keyframes of every file into a single compact index that can be memory-mapped "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--telemetry",
+        action="store",
+        default=None,
+        metavar="LOG",
+        help="append an event per processed file to this JSON-lines log (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        help="benchmark every scene change mode on a synthetic clip, and the source filters on --file if set "
+        "(default: %(default)s)",
+    )
     parser.add_argument(
         "-L",
         "--log-level",
@@ -280,8 +1018,14 @@ if __name__ == "__main__":
         ),
     )
 
+    return parser
+
+
+if __name__ == "__main__":
+    parser = build_parser()
     args = parser.parse_args()
 
+    setup_logging()
     logging.getLogger().setLevel(getattr(logging, args.log_level))
     logger.debug("Debug mode enabled.")
 
@@ -291,12 +1035,35 @@ if __name__ == "__main__":
         logger.error("Please set --file (-F) when using --outfile (-O)!")
         exit(1)
 
+    if args.jobs < 1:
+        logger.error("--jobs (-J) must be at least 1!")
+        exit(1)
+
+    if args.segments > 1 and args.segment_overlap < 1:
+        logger.error("--segment-overlap must be at least 1 when using --segments!")
+        exit(1)
+
+    # Set before the workers start, so they log to the same file
+    telemetry.configure(args.telemetry)
+
+    if args.benchmark:
+        benchmark(args)
+        exit(0)
+
     files = get_files(args)
     logger.debug(
         f"Files to process: {pprint.pformat([f.name for f in files], width=120)}"
     )
 
-    for f in files:
-        process_file(f, args)
+    start = time.perf_counter()
+    results = process_files(files, args)
+    log_summary(results, args.profile)
+    logger.info(f"Wall time: {time.perf_counter() - start:.2f}s")
+
+    if args.stats_json:
+        write_stats(results, args.stats_json)
+
+    if args.season_index:
+        write_season_index(results, args)
 
     logger.info("Done generating keyframes.")
@@ -4,38 +4,130 @@
 
     l-smash is used for m2ts files, ffms2 for everything else.
     l-smash can also be forced.
+
+    Indexed files are recorded in a small registry (.indexer.json),
+    so files whose index is still valid are skipped on later runs.
+    VapourSynth is only loaded once a file actually has to be indexed.
 """
 import argparse
-import mimetypes
-from glob import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from os import path
+from typing import Dict, List, Optional, Tuple
 
-import vapoursynth as vs
-
-try:
-    from lvsfunc import src
-except ModuleNotFoundError:
-    raise ModuleNotFoundError("Cannot find lvsfunc: Please install it here:"
-                              "<https://github.com/Irrational-Encoding-Wizardry/lvsfunc/>")
-
+import discovery
+import fileutil
+import telemetry
 
 __author__ = "LightArrowsEXE"
 __license__ = 'MIT'
-__version__ = '1.1.4'
+__version__ = '1.3.0'
+
+
+registry_file = '.indexer.json'
+
+# Files that get indexed: Matroska and m2ts, plus the video types of Python's built-in mimetypes table
+video_extensions = frozenset({
+    '.avi', '.m1v', '.m2ts', '.mkv', '.mov', '.movie', '.mp4', '.mpa', '.mpe', '.mpeg', '.mpg', '.qt', '.webm',
+})
+
+# Index files the different source filters write next to the source
+index_suffixes = ('.ffindex', '.lwi')
+
+
+def load_registry() -> Dict[str, dict]:
+    try:
+        with open(registry_file, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_registry(registry: Dict[str, dict]) -> None:
+    fileutil.write_json(registry_file, registry, indent=1, sort_keys=True)
+
+
+def fingerprint(f) -> dict:
+    st = os.stat(f)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def index_valid(f, entry: Optional[dict], force_lsmas: bool) -> bool:
+    """Check whether the recorded index still belongs to the source as it is now."""
+    return (entry is not None
+            and {k: entry.get(k) for k in ('size', 'mtime_ns')} == fingerprint(f)
+            and entry.get('force_lsmas') == force_lsmas
+            and path.isfile(entry['index']))
+
+
+def find_index(f) -> Optional[str]:
+    candidates = [f + suffix for suffix in index_suffixes if path.isfile(f + suffix)]
+    return max(candidates, key=path.getmtime) if candidates else None
+
+
+def load_vapoursynth() -> None:
+    """
+    Import VapourSynth and lvsfunc the first time a file actually has to be indexed,
+    so --help and runs where every index is up to date don't load any plugins.
+    """
+    global vs, src
+
+    if 'src' in globals():
+        return
+
+    import vapoursynth as vs
+
+    try:
+        from lvsfunc import src
+    except ModuleNotFoundError:
+        raise ModuleNotFoundError("Cannot find lvsfunc: Please install it here:"
+                                  "<https://github.com/Irrational-Encoding-Wizardry/lvsfunc/>")
+
+
+def index_file(f, force_lsmas: bool) -> Tuple[Optional[str], str]:
+    """
+    Index a single file. Runs in a worker process, so everything it needs is passed in.
+    Returns the index file (or None on failure) and a message to print.
+    """
+    with telemetry.measure('indexer', f, __version__, bytes=path.getsize(f)) as event:
+        load_vapoursynth()
+
+        try:
+            clip = src(f, force_lsmas=force_lsmas)
+        except vs.Error as e:
+            event['status'] = 'failed'
+            return None, f'Error while trying to index file!\n{e}\nContinuing to index other files.\n'
+
+        event['frames'] = clip.num_frames
+        return find_index(f), str(clip)
+
+
+def get_files() -> List[str]:
+    return [m.path for m in discovery.walk(recursive=args.recursive, extensions=video_extensions)]
 
 
 def index():
     print("Indexing files:\n")
-    files = glob('**/*', recursive=True) if args.recursive else glob('*')
+    registry = load_registry()
+
+    todo = []
+    for f in get_files():
+        if not args.reindex and index_valid(f, registry.get(f), args.force):
+            print(f"[*] Index for {f} is up to date")
+            telemetry.record('indexer', f, __version__, cache='hit', status='ok')
+        else:
+            todo.append(f)
 
-    for f in files:
-        mime = mimetypes.types_map.get(path.splitext(f)[-1], "")
-        if mime.startswith("video/") or f.endswith('.m2ts') or f.endswith('.mkv'):
-            try:
-                print(f"[+] Generating index file for {f}")
-                print(src(f, force_lsmas=args.force))
-            except vs.Error as e:
-                print(f'Error while trying to index file!\n{e}\nContinuing to index other files.\n')
+    # Only the indexing itself happens in the workers, the registry is kept up to date from here
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        results = pool.map(index_file, todo, [args.force] * len(todo))
+        for f, (idx, message) in zip(todo, results):
+            print(f"[+] Generating index file for {f}")
+            print(message)
+            if idx:
+                registry[f] = {**fingerprint(f), 'index': idx, 'force_lsmas': args.force}
+                save_registry(registry)
 
 
 if __name__ == "__main__":
@@ -46,6 +138,21 @@ if __name__ == "__main__":
     parser.add_argument("-F", "--force",
                         action="store_true", default=False,
                         help="force l-smash for indexing (default: %(default)s)")
+    parser.add_argument("-J", "--jobs",
+                        action="store", type=int, default=1,
+                        help="number of files to index at the same time (default: %(default)s)")
+    parser.add_argument("--reindex",
+                        action="store_true", default=False,
+                        help="index every file, even if its index is up to date (default: %(default)s)")
+    parser.add_argument("--telemetry",
+                        action="store", default=None, metavar="LOG",
+                        help="append an event per indexed file to this JSON-lines log (default: %(default)s)")
     args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    telemetry.configure(args.telemetry)
+
     index()
     input("\nDone generating index files. \n(press Enter to close this window...)")
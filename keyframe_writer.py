@@ -0,0 +1,181 @@
+"""
+Keyframe output layer for generate_keyframes.py.
+
+Renders any set of formats from one in-memory keyframe list, so detection only ever runs once per source:
+
+    * aegisub   <base>.txt      Aegisub keyframe format v1
+    * xvid      <base>.xvid     XviD 2-pass stats, one "i" (keyframe) or "p" line per frame
+    * plain     <base>.list     One frame number per line
+    * json      <base>.json     {"num_frames": ..., "keyframes": [...]}
+
+Every file is written to a temporary name next to it and renamed into place,
+so readers never see a half-written file.
+
+It can also write a season-level index holding the keyframes of every episode in a single file:
+
+    8 bytes     magic b"KFIDX" + NUL + format version (uint16, little-endian)
+    8 bytes     length of the JSON header (uint64, little-endian)
+    n bytes     JSON header: {"episodes": [{"name", "offset", "count", "num_frames"}, ...]}
+    padding     NUL bytes up to the next multiple of 8
+    rest        every episode's keyframes back to back as uint32 little-endian,
+                episode i taking `count` entries starting at entry `offset`
+
+The frame numbers can be memory-mapped as a flat array, instead of parsing dozens of text files.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Callable, Iterable
+
+import fileutil
+
+__author__ = "LightArrowsEXE"
+__license__ = "MIT"
+__version__ = "1.0"
+
+
+season_magic = b"KFIDX\x00" + struct.pack("<H", 1)
+
+
+def render_aegisub(keyframes: list[int], num_frames: int, header: bool = True) -> str:
+    lines = ["# keyframe format v1", "fps 0"] if header else []
+
+    return "\n".join(lines + [str(f) for f in keyframes]) + "\n"
+
+
+def render_xvid(keyframes: list[int], num_frames: int, header: bool = True) -> str:
+    keys = set(keyframes)
+    lines = ["# XviD 2pass stat file", ""] if header else []
+
+    return "\n".join(lines + ["i" if i in keys else "p" for i in range(num_frames)]) + "\n"
+
+
+def render_plain(keyframes: list[int], num_frames: int, header: bool = True) -> str:
+    return "".join(f"{f}\n" for f in keyframes)
+
+
+def render_json(keyframes: list[int], num_frames: int, header: bool = True) -> str:
+    return json.dumps({"num_frames": num_frames, "keyframes": list(keyframes)})
+
+
+# Format name -> (suffix, renderer)
+formats: dict[str, tuple[str, Callable[[list[int], int, bool], str]]] = {
+    "aegisub": (".txt", render_aegisub),
+    "xvid": (".xvid", render_xvid),
+    "plain": (".list", render_plain),
+    "json": (".json", render_json),
+}
+
+
+def parse_formats(formats_arg: str) -> list[str]:
+    """Parse a comma-separated list of format names, keeping their order."""
+
+    names = list(dict.fromkeys(name.strip().lower() for name in formats_arg.split(",") if name.strip()))
+
+    if not names:
+        raise ValueError("no keyframe formats given")
+
+    if unknown := [name for name in names if name not in formats]:
+        raise ValueError(f"unknown keyframe formats: {', '.join(unknown)} (pick from: {', '.join(formats)})")
+
+    return names
+
+
+def output_paths(base: Path, names: Iterable[str]) -> dict[str, Path]:
+    """Output path of every format, from the path without the suffix (like "ep01_keyframes")."""
+
+    return {name: base.with_name(base.name + formats[name][0]) for name in names}
+
+
+def write_keyframes(
+    paths: dict[str, Path], keyframes: Iterable[int], num_frames: int, header: bool = True, force: bool = False
+) -> list[Path]:
+    """
+    Render and write every format in `paths`, returning the files that were written.
+    Files that already exist are left alone, unless `force` is set.
+    """
+
+    keyframes = sorted(keyframes)
+    written = []
+
+    for name, path in paths.items():
+        if path.exists() and not force:
+            continue
+
+        fileutil.write_atomic(path, formats[name][1](keyframes, num_frames, header))
+        written.append(path)
+
+    return written
+
+
+def read_keyframes(path: Path) -> tuple[list[int], int | None]:
+    """Read keyframes back from any of the formats, with the frame count if the format records it."""
+
+    text = path.read_text()
+
+    if path.suffix == ".json":
+        data = json.loads(text)
+        return data["keyframes"], data["num_frames"]
+
+    lines = [line.strip() for line in text.splitlines()]
+
+    if lines and lines[0].startswith("# XviD"):
+        frames = [line for line in lines[1:] if line and not line.startswith("#")]
+        return [i for i, line in enumerate(frames) if line[0] == "i"], len(frames)
+
+    return [int(line) for line in lines if line and line[0].isdigit()], None
+
+
+def write_season_index(path: Path, episodes: dict[str, tuple[Iterable[int], int]]) -> None:
+    """Write the keyframes of every episode (name -> (keyframes, num_frames)) into one index file."""
+
+    frames = array("I")
+    entries = []
+
+    for name, (keyframes, num_frames) in episodes.items():
+        keyframes = sorted(keyframes)
+        entries.append({"name": name, "offset": len(frames), "count": len(keyframes), "num_frames": num_frames})
+        frames.extend(keyframes)
+
+    if sys.byteorder != "little":
+        frames.byteswap()
+
+    header = json.dumps({"episodes": entries}, separators=(",", ":")).encode()
+    padding = b"\0" * (-(len(season_magic) + 8 + len(header)) % 8)
+
+    fileutil.write_atomic(path, season_magic + struct.pack("<Q", len(header)) + header + padding + frames.tobytes())
+
+
+def read_season_index(path: Path) -> dict[str, tuple[list[int], int]]:
+    """Read a season index, memory-mapping the frame numbers instead of parsing them."""
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm[: len(season_magic)] != season_magic:
+            raise ValueError(f"{path} is not a keyframe season index")
+
+        (length,) = struct.unpack_from("<Q", mm, len(season_magic))
+        start = len(season_magic) + 8
+        header = json.loads(mm[start : start + length])
+        start += length + (-(start + length) % 8)
+
+        with memoryview(mm) as view, view[start:] as data:
+            if sys.byteorder == "little":
+                with data.cast("I") as frames:
+                    return {
+                        e["name"]: (frames[e["offset"] : e["offset"] + e["count"]].tolist(), e["num_frames"])
+                        for e in header["episodes"]
+                    }
+
+            frames = array("I", data.tobytes())
+            frames.byteswap()
+
+    return {
+        e["name"]: (frames[e["offset"] : e["offset"] + e["count"]].tolist(), e["num_frames"])
+        for e in header["episodes"]
+    }
@@ -0,0 +1,150 @@
+"""
+    Shared bulk move engine for the cleanup scripts in this repository.
+
+    Moves are planned up front, so a dry run can show exactly where everything will go,
+    and destinations that collide (with each other or with existing files) get a free name first.
+
+    Files on the same filesystem as their destination are renamed into place, so no data is copied.
+    Files on another filesystem are streamed into a temporary file next to the destination,
+    get their metadata copied over, are checked against the source, and only then take the final name.
+    Either way a file is claimed with a hard link where possible, so an existing file is never overwritten.
+"""
+import binascii
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Set
+
+__author__ = "LightArrowsEXE"
+__license__ = 'MIT'
+__version__ = '1.0'
+
+
+# Size of the buffer cross-device copies are streamed through
+copy_bufsize = 1024 * 1024
+
+
+class Move(NamedTuple):
+    src: str
+    dst: str
+
+
+class MoveResult(NamedTuple):
+    src: str
+    dst: str
+    method: str  # 'renamed', 'copied' or 'failed'
+    error: Optional[str] = None
+
+
+def free_name(dst: str, taken: Set[str] = frozenset()) -> str:
+    """`dst`, or the first of "name (1).ext", "name (2).ext", ... that doesn't exist and isn't taken."""
+    root, ext = os.path.splitext(dst)
+    candidate, n = dst, 0
+    while candidate in taken or os.path.lexists(candidate):
+        n += 1
+        candidate = f"{root} ({n}){ext}"
+    return candidate
+
+
+def plan(files: Iterable[str], dest_dir: str, root: Optional[str] = None) -> List[Move]:
+    """
+    Plan moving every file into `dest_dir`.
+    Files end up directly in `dest_dir`, unless `root` is given, in which case their path relative to it is kept.
+    """
+    taken: Set[str] = set()
+    moves = []
+    for f in files:
+        rel = os.path.relpath(f, root) if root is not None else os.path.basename(f)
+        dst = free_name(os.path.join(dest_dir, rel), taken)
+        taken.add(dst)
+        moves.append(Move(f, dst))
+    return moves
+
+
+def same_device(src: str, dest_dir: str) -> bool:
+    # The destination's directory might not exist yet, so check the nearest parent that does
+    while not os.path.exists(dest_dir):
+        parent = os.path.dirname(dest_dir)
+        if parent == dest_dir:
+            break
+        dest_dir = parent
+    return os.stat(src).st_dev == os.stat(dest_dir or '.').st_dev
+
+
+def claim(src: str, dst: str) -> str:
+    """
+    Atomically give `src` the name `dst`, or the next free name if `dst` is taken by then.
+    Both have to be on the same filesystem. Returns the name it ended up with.
+    """
+    while True:
+        try:
+            # A hard link fails instead of overwriting, unlike a rename
+            os.link(src, dst)
+        except FileExistsError:
+            dst = free_name(dst)
+            continue
+        except OSError:
+            # No hard links on this filesystem, so fall back to checking first
+            dst = free_name(dst)
+            os.replace(src, dst)
+            return dst
+        os.unlink(src)
+        return dst
+
+
+def _crc(f: str, bufsize: int = copy_bufsize) -> int:
+    crc, buf = 0, bytearray(bufsize)
+    view = memoryview(buf)
+    with open(f, 'rb', buffering=0) as file:
+        while (n := file.readinto(buf)):
+            crc = binascii.crc32(view[:n], crc)
+    return crc
+
+
+def copy_verified(src: str, dst: str, verify: bool = True) -> str:
+    """
+    Stream `src` into a temporary file next to `dst`, copy its metadata, check it and claim `dst`.
+    The temporary file is removed if anything goes wrong. Returns the name it ended up with.
+    """
+    tmp = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.partial")
+    crc, buf = 0, bytearray(copy_bufsize)
+    view = memoryview(buf)
+
+    try:
+        with open(src, 'rb', buffering=0) as fin, open(tmp, 'xb', buffering=0) as fout:
+            while (n := fin.readinto(buf)):
+                fout.write(view[:n])
+                crc = binascii.crc32(view[:n], crc)
+            os.fsync(fout.fileno())
+        shutil.copystat(src, tmp)
+
+        if os.path.getsize(tmp) != os.path.getsize(src):
+            raise OSError(f"size mismatch after copying {src}")
+        if verify and _crc(tmp) != crc:
+            raise OSError(f"CRC-32 mismatch after copying {src}")
+
+        return claim(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def move(m: Move, verify: bool = True) -> MoveResult:
+    """Move a single file, renaming it if possible and copying it otherwise."""
+    try:
+        os.makedirs(os.path.dirname(m.dst) or '.', exist_ok=True)
+        if same_device(m.src, os.path.dirname(m.dst)):
+            return MoveResult(m.src, claim(m.src, m.dst), 'renamed')
+
+        dst = copy_verified(m.src, m.dst, verify)
+        os.remove(m.src)
+        return MoveResult(m.src, dst, 'copied')
+    except OSError as e:
+        return MoveResult(m.src, m.dst, 'failed', str(e))
+
+
+def execute(moves: Iterable[Move], jobs: int = 1, verify: bool = True) -> Iterator[MoveResult]:
+    """Run the planned moves, yielding their results in plan order."""
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(lambda m: move(m, verify), moves)
@@ -3,6 +3,11 @@
 """
     Removes all empty directories located in the current directory.
 
+    The tree is walked once, bottom-up, counting what's left in every directory.
+    A directory is removed as soon as it's known to be empty,
+    so rmdir is never tried on directories that still contain something.
+    Top-level subtrees can be walked in parallel, which helps on network filesystems.
+
     Huge parts were taken from a comment on this gist;
       https://gist.github.com/jacobtomlinson/9031697#gistcomment-3130652
     As well as this stackoverflow post:
@@ -10,12 +15,79 @@
 """
 
 import argparse
-import glob
 import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
 __author__  = 'LightArrowsEXE'
 __license__ = 'MIT'
-__version__ = '1.0.2'
+__version__ = '1.1.0'
+
+
+def prune(dirname, removed: List[str], dry_run: bool = False) -> bool:
+    """
+    Remove every empty directory below `dirname`, deepest first, appending them to `removed`.
+    Returns whether `dirname` itself is empty afterwards (it's never removed here).
+    """
+    try:
+        with os.scandir(dirname) as it:
+            entries = list(it)
+    except OSError:  # can't look inside, so treat it as not empty
+        return False
+
+    remaining = len(entries)
+    for entry in entries:
+        # Symlinks to directories are left alone, they're entries like any other file
+        if entry.is_dir(follow_symlinks=False) \
+                and prune(entry.path, removed, dry_run) and remove(entry.path, dry_run):
+            removed.append(entry.path)
+            remaining -= 1
+
+    return remaining == 0
+
+
+def is_empty(dirname) -> bool:
+    try:
+        with os.scandir(dirname) as it:
+            return next(it, None) is None
+    except OSError:
+        return False
+
+
+def remove(dirname, dry_run: bool) -> bool:
+    if dry_run:
+        return True
+    try:
+        os.rmdir(dirname)
+        return True
+    except OSError:  # something was written to it in the meantime
+        return False
+
+
+def prune_subtree(dirname) -> List[str]:
+    """Prune a top-level directory and everything in it, including the directory itself."""
+    removed: List[str] = []
+    empty = prune(dirname, removed, args.dry_run) if args.recursive else is_empty(dirname)
+    if empty and remove(dirname, args.dry_run):
+        removed.append(dirname)
+    return removed
+
+
+def prune_tree(root) -> List[str]:
+    """Prune every top-level directory in `root`, returning everything that was removed in order."""
+    with os.scandir(root) as it:
+        top = sorted(e.path for e in it if e.is_dir(follow_symlinks=False))
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        return [pdir for removed in pool.map(prune_subtree, top) for pdir in removed]
+
+
+def main():
+    label = "Would delete" if args.dry_run else "Deleted"
+    for pdir in prune_tree(os.getcwd()):
+        print(f"[-] {label} \"{pdir}\"")
 
 
 def fast_scandir(dirname):
@@ -25,28 +97,78 @@ def fast_scandir(dirname):
     return subfolders
 
 
-def main():
-    L = sorted(
-        fast_scandir(os.getcwd()),
-        key=lambda p: len(str(p)),
-        reverse=True,
-    )
-
-    for pdir in L:
-        try: # remove directory if empty
+def legacy_prune(dirname) -> int:
+    """The old approach: list everything, sort by path length and try rmdir on all of it."""
+    removed = 0
+    for pdir in sorted(fast_scandir(dirname), key=lambda p: len(str(p)), reverse=True):
+        try:
             os.rmdir(pdir)
-            print(f"[-] Deleted \"{pdir}\"")
-        except OSError: # catch and continue if non-empty
+            removed += 1
+        except OSError:
             continue
+    return removed
+
+
+def build_tree(root, count: int, fanout: int = 10, keep_every: int = 7) -> None:
+    """Create `count` nested directories below `root`, with a file in every `keep_every`th one."""
+    dirs, made = [root], 0
+    while made < count:
+        parent = dirs.pop(0)
+        for _ in range(min(fanout, count - made)):
+            made += 1
+            d = os.path.join(parent, str(made))
+            os.mkdir(d)
+            if made % keep_every == 0:
+                open(os.path.join(d, "file.txt"), 'w').close()
+            dirs.append(d)
+
+
+def benchmark(count: int) -> None:
+    """Time the old and new approach on identical synthetic trees."""
+    print(f"[*] Benchmarking on a synthetic tree of {count} directories\n")
+    runs = [("legacy (sort + rmdir everything)", legacy_prune, 1),
+            ("bottom-up walk", lambda d: len(prune_tree(d)), 1)]
+    if args.jobs > 1:
+        runs.append((f"bottom-up walk, {args.jobs} jobs", lambda d: len(prune_tree(d)), args.jobs))
+
+    for name, run, jobs in runs:
+        args.jobs = jobs
+        with tempfile.TemporaryDirectory(prefix="red_bench_") as tmp:
+            build_tree(tmp, count)
+            start = time.perf_counter()
+            removed = run(tmp)
+            elapsed = time.perf_counter() - start
+            left = sum(len(dirs) for _, dirs, _ in os.walk(tmp))
+            print(f"[+] {name}: {elapsed:.3f}s, removed {removed}, {left} left")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-R", "--recursive",
-                        action="store_false", default=True,
-                        help="Encode files recursively (default: %(default)s)")
-    parser.parse_args()
+                        action="store_true", default=True,
+                        help="Remove empty directories recursively (the default, kept for compatibility)")
+    parser.add_argument("--no-recursive",
+                        action="store_false", dest="recursive",
+                        help="Only remove top-level directories that are empty")
+    parser.add_argument("-n", "--dry-run",
+                        action="store_true", default=False,
+                        help="Only print what would be deleted (default: %(default)s)")
+    parser.add_argument("-J", "--jobs",
+                        action="store", type=int, default=1,
+                        help="Number of top-level directories to walk at the same time, "
+                             "useful on network filesystems (default: %(default)s)")
+    parser.add_argument("--benchmark",
+                        action="store", type=int, nargs="?", const=100_000, default=None, metavar="DIRS",
+                        help="Time the old and new approach on a synthetic tree of DIRS directories "
+                             "(default DIRS: 100000) instead of removing anything")
     args = parser.parse_args()
 
-    main()
-    input("\nDone (Press \"Enter\" to close this window)")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    if args.benchmark:
+        args.dry_run = False
+        benchmark(args.benchmark)
+    else:
+        main()
+        input("\nDone (Press \"Enter\" to close this window)")
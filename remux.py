@@ -6,50 +6,148 @@
     -R - Check recursively
     -i - change input extension
     -o - change output extension
+    -J - number of remuxes to run at the same time
+    -f - remux even if the output is already up to date
+    --timeout - kill any remux that takes longer than this many seconds
+    --proc-stats - print how long ffmpeg ran and how much memory it used
+    --telemetry - append an event per remuxed file to this JSON-lines log
 
-    TO-DO: clean up
+    Outputs that are newer than their input and have the same duration are skipped.
 """
-import os
-import glob
 import argparse
-import subprocess
-import time
-
-parser = argparse.ArgumentParser()
-parser.add_argument("-R", "--recursive",
-                    help="check recursively", action="store_true")
-parser.add_argument("-i", "--input_ext",
-                    help="set input's extension (default: mkv)")
-parser.add_argument("-o", "--output_ext",
-                    help="set output's extension (default: mp4)")
-args = parser.parse_args()
-
-if args.recursive:
-    filelist = glob.glob('**/*', recursive=True)
-else:
-    filelist = glob.glob('*')
-
-if args.input_ext:
-    ext_in = args.input_ext
-    if ext_in.startswith("."):
-        ext_in = ext_in[1:]
-else:
-    ext_in = "mkv"
-
-if args.output_ext:
-    ext_out = args.output_ext
-    if ext_out.startswith("."):
-        ext_out = ext_out[1:]
-else:
-    ext_out = "mp4"
-
-print(f"Remuxing all {ext_in} to {ext_out}\n")
-time.sleep(1)
-
-for f in filelist:
-    if f.endswith(ext_in):
-        subprocess.call(["ffmpeg", "-hide_banner", "-loglevel", "panic", "-i", f"{os.path.splitext(f)[0]}.{ext_in}", "-c", "copy", f"{os.path.splitext(f)[0]}.{ext_out}"])
-        print(f"Remuxing:\n{f} ->\n{os.path.splitext(f)[0]}.{ext_out}\n")
-    else:
-        pass
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import discovery
+import runner
+import telemetry
+
+__author__ = "LightArrowsEXE"
+__license__ = 'MIT'
+__version__ = '1.0'
+
+
+# Maximum difference in seconds between input and output duration for the output to count as up to date.
+duration_tolerance = 0.5
+
+
+def get_duration(f) -> Optional[float]:
+    if not shutil.which(runner.resolve(["ffprobe"])[0]):
+        return None
+
+    _, probe = runner.output(["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                              "-of", "default=noprint_wrappers=1:nokey=1", f], timeout=args.timeout)
+    try:
+        return float(probe.strip())
+    except ValueError:
+        return None
+
+
+def up_to_date(src, out) -> bool:
+    """Check whether the output is newer than the input and has the same duration."""
+    if not os.path.isfile(out) or os.path.getmtime(out) < os.path.getmtime(src):
+        return False
+
+    src_duration, out_duration = get_duration(src), get_duration(out)
+    if src_duration is None or out_duration is None:
+        # Can't tell, so only trust the timestamps if ffprobe isn't available at all
+        return not shutil.which(runner.resolve(["ffprobe"])[0])
+    return abs(src_duration - out_duration) <= duration_tolerance
+
+
+def remux(f, ext_out: str) -> Tuple[str, int]:
+    """Remux a single file, writing to a temporary name first. Returns a status label and exit code."""
+    with runner.collect() as usages, \
+            telemetry.measure("remux", f, __version__, bytes=os.path.getsize(f), children=usages) as event:
+        out = f"{os.path.splitext(f)[0]}.{ext_out}"
+        if not args.force and up_to_date(f, out):
+            event.update(bytes=None, cache='hit')
+            return "skipped", 0
+        event['cache'] = None if args.force else 'miss'
+
+        temp = f"{os.path.splitext(f)[0]}.partial.{ext_out}"
+        code = runner.run(["ffmpeg", "-hide_banner", "-loglevel", "panic", "-y",
+                           "-i", f, "-c", "copy", temp], timeout=args.timeout)
+        if code == 0 and os.path.isfile(temp):
+            os.replace(temp, out)
+            return "remuxed", 0
+
+        if os.path.exists(temp):
+            os.remove(temp)
+        event['status'] = 'failed'
+        return "failed", code or -1
+
+
+def get_files(ext_in: str) -> List[str]:
+    return [m.path for m in discovery.walk(recursive=args.recursive, extensions={f".{ext_in}"})
+            if '.partial.' not in os.path.basename(m.path)]
+
+
+def main() -> None:
+    ext_in = (args.input_ext or "mkv").lstrip(".")
+    ext_out = (args.output_ext or "mp4").lstrip(".")
+
+    print(f"Remuxing all {ext_in} to {ext_out}\n")
+    files = get_files(ext_in)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        try:
+            for f, (status, code) in zip(files, pool.map(lambda f: remux(f, ext_out), files)):
+                out = f"{os.path.splitext(f)[0]}.{ext_out}"
+                if status == "skipped":
+                    print(f"[*] {out} is up to date")
+                elif status == "remuxed":
+                    print(f"Remuxing:\n{f} ->\n{out}\n")
+                else:
+                    print(f"[!] Remuxing {f} failed (exit status {code})")
+                    failed += 1
+        except KeyboardInterrupt:
+            # The children are in their own process groups and never saw the Ctrl+C
+            pool.shutdown(wait=False, cancel_futures=True)
+            runner.cancel()
+            raise
+
+    if args.proc_stats:
+        print("\nProcesses:")
+        for line in runner.summary():
+            print(f"  {line}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-R", "--recursive",
+                        help="check recursively", action="store_true")
+    parser.add_argument("-i", "--input_ext",
+                        help="set input's extension (default: mkv)")
+    parser.add_argument("-o", "--output_ext",
+                        help="set output's extension (default: mp4)")
+    parser.add_argument("-J", "--jobs",
+                        action="store", type=int, default=1,
+                        help="number of remuxes to run at the same time (default: %(default)s)")
+    parser.add_argument("-f", "--force",
+                        action="store_true", default=False,
+                        help="remux even if the output is up to date (default: %(default)s)")
+    parser.add_argument("--timeout",
+                        action="store", type=float, default=None,
+                        help="kill any remux that runs for longer than this many seconds (default: %(default)s)")
+    parser.add_argument("--proc-stats",
+                        action="store_true", default=False,
+                        help="print wall time, CPU time and peak memory per tool at the end (default: %(default)s)")
+    parser.add_argument("--telemetry",
+                        action="store", default=None, metavar="LOG",
+                        help="append an event per remuxed file to this JSON-lines log (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    telemetry.configure(args.telemetry)
 
+    main()
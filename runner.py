@@ -0,0 +1,297 @@
+"""
+    Shared runner for the external tools (ffmpeg, eac3to, qaac, flac, ...) the scripts in this repository call.
+
+     - A global limiter caps how many children are alive at once, optionally with a lower cap per tool
+       (for example at most 2 eac3to's alongside 8 qaac's).
+     - Every child runs in its own process group, so a timeout kills the whole tree it started,
+       not just the child itself. That also keeps Ctrl+C from reaching the children:
+       scripts call `cancel()` from their KeyboardInterrupt handler to kill every child that's still alive.
+     - Every child is recorded with its exit status, wall time, CPU time and peak RSS,
+       so batch settings can be tuned from actual numbers.
+     - Any tool can be swapped for another executable through `tools` or a RUNNER_<TOOL> environment
+       variable (RUNNER_FFMPEG=/path/to/stub), which is handy for testing without the real encoders.
+
+    CPU time and peak RSS come from wait4's resource usage, so they're only available on POSIX systems.
+"""
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import fileutil
+
+__author__ = "LightArrowsEXE"
+__license__ = 'MIT'
+__version__ = '1.0'
+
+
+_posix = os.name == 'posix'
+
+# Tool name -> executable to run instead, on top of the RUNNER_<TOOL> environment variables
+tools: Dict[str, str] = {}
+
+
+class Usage(NamedTuple):
+    tool: str
+    returncode: int
+    wall: float
+    cpu: Optional[float]  # user + system seconds
+    max_rss_mb: Optional[float]
+    timed_out: bool = False
+
+
+class ProcessLimiter:
+    """Caps how many child processes are alive at once, overall and per tool."""
+
+    def __init__(self, limit: int, per_tool: Optional[Dict[str, int]] = None) -> None:
+        self.limit = limit
+        self.per_tool = dict(per_tool or {})
+        self._free = limit
+        self._used: Counter = Counter()
+        self._cond = threading.Condition()
+
+    def _fits(self, n: int, wanted: Counter) -> bool:
+        return self._free >= n and all(self._used[t] + c <= self.per_tool[t]
+                                       for t, c in wanted.items() if t in self.per_tool)
+
+    @contextmanager
+    def slots(self, *names: str):
+        """
+        Reserve a slot for every tool that's about to run at the same time.
+        A job takes all of its slots at once, so jobs can't deadlock each other halfway through.
+        """
+        wanted = Counter(tool_name(name) for name in names)
+        # Never wait for more than could ever be free
+        n = min(len(names), self.limit)
+        for t in wanted:
+            if t in self.per_tool:
+                wanted[t] = min(wanted[t], self.per_tool[t])
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._fits(n, wanted))
+            self._free -= n
+            self._used.update(wanted)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._free += n
+                self._used.subtract(wanted)
+                self._cond.notify_all()
+
+
+limiter = ProcessLimiter(os.cpu_count() or 1)
+
+history: List[Usage] = []
+_history_lock = threading.Lock()
+
+# Usage lists of the collect() blocks running in every thread
+_local = threading.local()
+
+# Children that haven't been waited for yet, for cancel()
+_live: Set['Process'] = set()
+_live_lock = threading.Lock()
+_cancelled = False
+
+
+class Cancelled(Exception):
+    """Raised when a child is started after cancel()."""
+
+
+def configure(max_procs: Optional[int] = None, per_tool: Optional[Dict[str, int]] = None) -> None:
+    """Replace the global limiter. Only call this while nothing is running."""
+    global limiter
+    limiter = ProcessLimiter(max_procs or os.cpu_count() or 1, per_tool)
+
+
+@contextmanager
+def collect() -> Iterator[List[Usage]]:
+    """Gather the usage of every child this thread waits for inside the block, like the ones started for a single file."""
+    outer = getattr(_local, 'usages', None)
+    usages = _local.usages = []
+    try:
+        yield usages
+    finally:
+        _local.usages = outer
+        if outer is not None:
+            outer.extend(usages)
+
+
+def parse_limits(spec: Optional[str]) -> Dict[str, int]:
+    """Parse per-tool limits like "eac3to=2,qaac=8"."""
+    limits = {}
+    for part in filter(None, (spec or "").split(",")):
+        name, _, count = part.partition("=")
+        if not count.strip().isdigit() or int(count) < 1:
+            raise ValueError(f"invalid tool limit {part!r}, expected tool=count")
+        limits[tool_name(name.strip())] = int(count)
+    return limits
+
+
+def tool_name(exe: str) -> str:
+    """The name a tool is limited, recorded and overridden by: "C:/bin/FFmpeg.exe" -> "ffmpeg"."""
+    return os.path.splitext(os.path.basename(exe))[0].lower()
+
+
+def resolve(cmd: Sequence[str]) -> List[str]:
+    name = tool_name(cmd[0])
+    override = tools.get(name) or os.environ.get(f"RUNNER_{re.sub(r'[^A-Z0-9]', '_', name.upper())}")
+    return [override or cmd[0], *cmd[1:]]
+
+
+def _rss_mb(maxrss: int) -> float:
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    return maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class Process:
+    """
+    A child process in its own process group.
+    Mirrors the parts of subprocess.Popen the scripts use (stdin, stdout, wait, kill),
+    and records the child's resource usage once it's waited for.
+    """
+
+    def __init__(self, cmd: Sequence[str], timeout: Optional[float] = None, **kwargs) -> None:
+        self.tool = tool_name(cmd[0])
+        self.timed_out = False
+        self.usage: Optional[Usage] = None
+
+        # Children shouldn't read the terminal (ffmpeg does by default), unless they're given something to read
+        kwargs.setdefault('stdin', subprocess.DEVNULL)
+        if _posix:
+            kwargs['start_new_session'] = True
+
+        # Started under the lock, so cancel() can't miss a child that's starting right now
+        with _live_lock:
+            if _cancelled:
+                raise Cancelled(f"not starting {self.tool}, the run was cancelled")
+            self._start = time.perf_counter()
+            self._popen = subprocess.Popen(resolve(cmd), **kwargs)
+            _live.add(self)
+        self.pid = self._popen.pid
+        self.stdin, self.stdout = self._popen.stdin, self._popen.stdout
+
+        self._timer = None
+        if timeout:
+            self._timer = threading.Timer(timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.usage.returncode if self.usage else None
+
+    def _expire(self) -> None:
+        self.timed_out = True
+        self.kill()
+
+    def kill(self) -> None:
+        """Kill the child and everything it started."""
+        if self.usage:
+            return
+        try:
+            if _posix:
+                os.killpg(self.pid, signal.SIGKILL)
+            else:
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(self.pid)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except ProcessLookupError:  # already gone
+            pass
+
+    def wait(self) -> int:
+        if self.usage:
+            return self.usage.returncode
+
+        if hasattr(os, 'wait4'):
+            # Reaped here instead of in Popen, since wait4 also returns the child's own resource usage
+            _, status, ru = os.wait4(self.pid, 0)
+            code = self._popen.returncode = os.waitstatus_to_exitcode(status)
+            cpu, rss = ru.ru_utime + ru.ru_stime, _rss_mb(ru.ru_maxrss)
+        else:
+            code, cpu, rss = self._popen.wait(), None, None
+
+        with _live_lock:
+            _live.discard(self)
+        if self._timer:
+            self._timer.cancel()
+        self.usage = Usage(self.tool, code, time.perf_counter() - self._start, cpu, rss, self.timed_out)
+        with _history_lock:
+            history.append(self.usage)
+        if getattr(_local, 'usages', None) is not None:
+            _local.usages.append(self.usage)
+        return code
+
+    def __enter__(self) -> 'Process':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # Interrupted or failed halfway through: don't leave anything running
+        if exc_type is not None:
+            self.kill()
+        for pipe in (self.stdin, self.stdout):
+            if pipe:
+                try:
+                    pipe.close()
+                except BrokenPipeError:
+                    pass
+        self.wait()
+
+
+def cancel() -> None:
+    """Kill every child that's still alive, and refuse to start new ones. Meant for KeyboardInterrupt handlers."""
+    global _cancelled
+    with _live_lock:
+        _cancelled = True
+        procs = list(_live)
+    for proc in procs:
+        proc.kill()
+
+
+def run(cmd: Sequence[str], timeout: Optional[float] = None, limit: bool = True, **kwargs) -> int:
+    """
+    Run a command to completion and return its exit status.
+    Takes a slot from the global limiter first, unless `limit` is False (the caller already holds one).
+    """
+    with limiter.slots(cmd[0]) if limit else nullcontext():
+        with Process(cmd, timeout, **kwargs) as proc:
+            return proc.wait()
+
+
+def output(cmd: Sequence[str], timeout: Optional[float] = None, limit: bool = True) -> Tuple[int, str]:
+    """Run a command to completion, returning its exit status and its stdout as text."""
+    with limiter.slots(cmd[0]) if limit else nullcontext():
+        with Process(cmd, timeout, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+            out = proc.stdout.read().decode(errors='replace')
+            return proc.wait(), out
+
+
+def summary() -> List[str]:
+    """One line per tool with its totals so far."""
+    with _history_lock:
+        records = list(history)
+
+    lines = []
+    for name in sorted({u.tool for u in records}):
+        runs = [u for u in records if u.tool == name]
+        line = f"{name}: {len(runs)} run(s), {sum(u.wall for u in runs):.1f}s wall"
+        if all(u.cpu is not None for u in runs):
+            line += f", {sum(u.cpu for u in runs):.1f}s CPU, peak {max(u.max_rss_mb for u in runs):.1f} MiB"
+        failed, timed_out = sum(u.returncode != 0 for u in runs), sum(u.timed_out for u in runs)
+        if failed:
+            line += f", {failed} failed"
+        if timed_out:
+            line += f", {timed_out} timed out"
+        lines.append(line)
+    return lines
+
+
+def write_stats(path: str) -> None:
+    with _history_lock:
+        records = [u._asdict() for u in history]
+    fileutil.write_json(path, records, indent=1)
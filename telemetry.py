@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+    Shared run telemetry for the scripts in this repository.
+
+    The per-file loops of the scripts (hashing, encoding, remuxing, indexing, keyframe generation)
+    record one event per file: bytes and frames processed, wall and CPU time, MB/s or fps,
+    whether a cache made the work unnecessary, and how it ended ('ok', 'failed' or 'error: <exception>').
+    Events are appended as JSON lines to the log given with --telemetry, or in the TELEMETRY_LOG environment variable.
+    Nothing is recorded when neither is set.
+
+    CPU time is the time spent by the thread that handled the file.
+    The CPU time of the external tools started for it is recorded separately, as child_cpu.
+
+    Run this module on one or more logs to summarise them, with throughput percentiles per tool and version:
+        python telemetry.py run1.jsonl run2.jsonl
+"""
+import argparse
+import json
+import math
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+__author__ = "LightArrowsEXE"
+__license__ = 'MIT'
+__version__ = '1.0'
+
+
+env_var = 'TELEMETRY_LOG'
+
+
+class EventSink:
+    """Appends events to a JSON-lines file. Safe to share between threads, and between processes through O_APPEND."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+
+    def emit(self, event: dict) -> None:
+        # One unbuffered write per event, so lines from different processes can't interleave
+        line = (json.dumps(event, separators=(',', ':')) + '\n').encode()
+        with self._lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.write(self._fd, line)
+
+
+sink: Optional[EventSink] = EventSink(os.environ[env_var]) if os.environ.get(env_var) else None
+
+
+def configure(path: Optional[str]) -> None:
+    """Send events to `path`. Child processes started afterwards log there too."""
+    global sink
+    if not path:
+        return
+    sink = EventSink(os.path.abspath(path))
+    os.environ[env_var] = sink.path
+
+
+@contextmanager
+def measure(tool: str, file, version: Optional[str] = None, **fields) -> Iterator[dict]:
+    """
+    Time the work done on a single file and record it as an event.
+    The body can fill in `bytes`, `frames`, `cache` ('hit' or 'miss') and `status` on the yielded dict.
+    Pass the list from runner.collect() as `children` to also record the CPU time of the external tools it ran.
+    """
+    event = {'bytes': None, 'frames': None, 'cache': None, 'status': 'ok', **fields}
+    start, cpu_start = time.perf_counter(), time.thread_time()
+
+    try:
+        yield event
+    except BaseException as e:
+        event['status'] = f'error: {type(e).__name__}'
+        raise
+    finally:
+        if sink:
+            wall = time.perf_counter() - start
+            if (children := event.pop('children', None)) is not None:
+                event['child_cpu'] = child_cpu(children)
+            record(tool, str(file), version, wall=wall, cpu=time.thread_time() - cpu_start, **event)
+
+
+def child_cpu(usages) -> Optional[float]:
+    """Total CPU time of a list of runner.Usage's, or None where the platform doesn't report it."""
+    cpus = [u.cpu for u in usages]
+    return round(sum(cpus), 6) if None not in cpus else None
+
+
+def record(tool: str, file: str, version: Optional[str] = None, wall: float = 0.0, **fields) -> None:
+    """Record a finished event, deriving MB/s and fps from the bytes and frames processed."""
+    if not sink:
+        return
+
+    event = {'ts': round(time.time(), 3), 'host': socket.gethostname(), 'pid': os.getpid(),
+             'tool': tool, 'version': version, 'file': file, 'wall': round(wall, 6), **fields}
+    if 'cpu' in event and event['cpu'] is not None:
+        event['cpu'] = round(event['cpu'], 6)
+    if wall > 0 and event.get('bytes'):
+        event['mb_s'] = round(event['bytes'] / wall / 1e6, 3)
+    if wall > 0 and event.get('frames'):
+        event['fps'] = round(event['frames'] / wall, 3)
+    sink.emit(event)
+
+
+def read_events(paths: Iterable[str]) -> Iterator[dict]:
+    for path in paths:
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:  # cut off by a crash, skip it
+                    continue
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    # p * n / 100 rather than p / 100 * n, which is 7.000000000000001 for p=7, n=100
+    return values[max(0, min(len(values) - 1, math.ceil(p * len(values) / 100) - 1))]
+
+
+def summary(events: Iterable[dict], percentiles: Iterable[float] = (50, 90, 99)) -> List[str]:
+    """Per tool (and op) and version: file count, data processed, cache hit rate and throughput percentiles."""
+    groups: Dict[tuple, List[dict]] = defaultdict(list)
+    for e in events:
+        # Tools that do more than one thing (like hashing and verifying) tell them apart with `op`
+        name = f"{e.get('tool', '?')} {e['op']}" if e.get('op') else e.get('tool', '?')
+        groups[(name, e.get('version') or '?')].append(e)
+
+    percentiles = tuple(percentiles)
+    lines = []
+    for (tool, version), group in sorted(groups.items()):
+        hits = sum(e.get('cache') == 'hit' for e in group)
+        cached = sum(e.get('cache') in ('hit', 'miss') for e in group)
+        errors = sum(e.get('status', 'ok') != 'ok' for e in group)
+        total_bytes = sum(e.get('bytes') or 0 for e in group)
+
+        line = f"{tool} {version}: {len(group)} files, {total_bytes / 1e9:.2f} GB"
+        if cached:
+            line += f", cache hits {hits}/{cached} ({hits / cached:.0%})"
+        if errors:
+            line += f", {errors} failed"
+        lines.append(line)
+
+        # Cache hits did no real work, so they'd only skew the throughput numbers
+        worked = [e for e in group if e.get('cache') != 'hit']
+        for key, label, unit in (('mb_s', 'MB/s', ''), ('fps', 'fps', ''), ('wall', 'wall', 's'),
+                                 ('cpu', 'cpu', 's'), ('child_cpu', 'tools', 's')):
+            values = sorted(e[key] for e in worked if isinstance(e.get(key), (int, float)))
+            if values:
+                cols = "  ".join(f"p{p:g} {percentile(values, p):10.2f}{unit}" for p in percentiles)
+                lines.append(f"    {label:<5} {cols}  (n={len(values)})")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise telemetry logs")
+    parser.add_argument("logs",
+                        nargs="+",
+                        help="JSON-lines telemetry logs to summarise")
+    parser.add_argument("-T", "--tool",
+                        action="append", default=None,
+                        help="only summarise these tools (default: all)")
+    parser.add_argument("-P", "--percentiles",
+                        action="store", default="50,90,99",
+                        help="comma-separated percentiles to show (default: %(default)s)")
+    args = parser.parse_args()
+
+    try:
+        wanted = [float(p) for p in args.percentiles.split(",")]
+    except ValueError:
+        parser.error("--percentiles must be a comma-separated list of numbers")
+
+    events = (e for e in read_events(args.logs) if not args.tool or e.get('tool') in args.tool)
+    for line in summary(events, wanted) or ["No events"]:
+        print(line)
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+"""
+    Watches the current directory for new media and runs the other scripts on it.
+
+    New or changed files are debounced until their size and mtime stop changing,
+    then handed through a bounded work queue to the enabled tools, in this order:
+     - keyframes    (generate_keyframes.py's process_file)
+     - index        (indexer.py's index_file)
+     - encode       (encode_audio.py's encode_main)
+     - crc          (auto-CRC.py's calculate_crc, last since it renames the file)
+
+    Uses inotify through inotify_simple where it's available (Linux), and polls otherwise.
+    Polling uses a directory snapshot, so only directories whose contents changed are rescanned.
+    Files that are modified in place are only picked up with inotify.
+
+    Optional dependencies:
+     - inotify_simple   (https://github.com/chrisjbillington/inotify_simple)
+"""
+import argparse
+import importlib
+import importlib.util
+import os
+import queue
+import shlex
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import discovery
+import telemetry
+
+try:
+    from inotify_simple import INotify, flags
+
+    _inotify_available = True
+except ImportError:
+    _inotify_available = False
+
+__author__ = "LightArrowsEXE"
+__license__ = 'MIT'
+__version__ = '1.0'
+
+
+# (name, should this tool run on this file, run it and return the file's new path or None if it's gone)
+Tool = Tuple[str, Callable[[str], bool], Callable[[str], Optional[str]]]
+
+print_lock = threading.Lock()
+
+
+def log(msg: str) -> None:
+    with print_lock:
+        print(f"{time.strftime('%H:%M:%S')} {msg}", flush=True)
+
+
+def fingerprint(f) -> Optional[Tuple[int, int, int, int]]:
+    try:
+        st = os.stat(f)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def is_media(f) -> bool:
+    return discovery.classify(f).split('/', 1)[0] in ('video', 'audio') \
+        and not os.path.basename(f).startswith('.') and '.partial.' not in os.path.basename(f)
+
+
+class Debouncer:
+    """Holds on to files until their size and mtime haven't changed for `settle` seconds."""
+
+    def __init__(self, settle: float) -> None:
+        self.settle = settle
+        self.pending: Dict[str, Tuple[Optional[tuple], float]] = {}
+
+    def touch(self, f: str) -> None:
+        self.pending[f] = (fingerprint(f), time.monotonic())
+
+    def ready(self) -> List[str]:
+        now, done = time.monotonic(), []
+        for f, (last, since) in list(self.pending.items()):
+            current = fingerprint(f)
+            if current is None:  # removed or renamed away before it settled
+                del self.pending[f]
+            elif current != last:
+                self.pending[f] = (current, now)
+            elif now - since >= self.settle:
+                del self.pending[f]
+                done.append(f)
+        return sorted(done)
+
+
+class Poller:
+    """Finds new files by walking the tree, listing unchanged directories from an in-memory snapshot."""
+
+    def __init__(self, recursive: bool) -> None:
+        self.recursive = recursive
+        self.snapshot: dict = {}
+        self.known = set(self._walk())
+
+    def _walk(self) -> Iterable[str]:
+        return (m.path for m in discovery.walk(recursive=self.recursive, kinds={'video', 'audio'},
+                                               snapshot=self.snapshot))
+
+    def changes(self, timeout: float) -> List[str]:
+        time.sleep(timeout)
+        current = set(self._walk())
+        new, self.known = current - self.known, current
+        return sorted(new)
+
+
+class InotifyWatcher:
+    """Reports files that were closed after writing or moved into the tree."""
+
+    file_flags = flags.CLOSE_WRITE | flags.MOVED_TO if _inotify_available else 0
+    dir_flags = flags.CREATE | flags.MOVED_TO if _inotify_available else 0
+
+    def __init__(self, recursive: bool) -> None:
+        self.recursive = recursive
+        self.inotify = INotify()
+        self.dirs: Dict[int, str] = {}
+        self._add('.')
+
+    def _add(self, d: str) -> List[str]:
+        """Watch a directory (and its subdirectories), returning the files already in it."""
+        try:
+            self.dirs[self.inotify.add_watch(d, self.file_flags | self.dir_flags)] = d
+        except OSError:
+            return []
+        found = []
+        with os.scandir(d) as it:
+            for entry in it:
+                path = os.path.normpath(os.path.join(d, entry.name))
+                if entry.is_dir(follow_symlinks=False):
+                    if self.recursive and not entry.name.startswith('.') and entry.name not in discovery.ignored_dirs:
+                        found += self._add(path)
+                else:
+                    found.append(path)
+        return found
+
+    def changes(self, timeout: float) -> List[str]:
+        found = []
+        for event in self.inotify.read(timeout=int(timeout * 1000)):
+            d = self.dirs.get(event.wd)
+            if d is None or not event.name:
+                continue
+            path = os.path.normpath(os.path.join(d, event.name))
+            if event.mask & flags.ISDIR:
+                # Files can land in a new directory before it's watched, so pick those up too
+                if self.recursive:
+                    found += self._add(path)
+            elif event.mask & self.file_flags:
+                found.append(path)
+        return sorted(p for p in set(found) if is_media(p))
+
+
+def load_tools(opts: argparse.Namespace, ignored: Set[str]) -> List[Tool]:
+    """Import the enabled scripts and set them up as if they'd been run with the given arguments."""
+    tools: List[Tool] = []
+    is_video: Callable[[str], bool] = lambda f: discovery.classify(f).startswith('video/')
+
+    if opts.keyframes:
+        gk = importlib.import_module('generate_keyframes')
+        gk.args = gk.build_parser().parse_args(shlex.split(opts.keyframes_args))
+        gk.setup_logging()
+
+        def keyframes(f: str) -> Optional[str]:
+            gk.process_file(gk.Path(os.path.abspath(f)), gk.args)
+            return f
+
+        tools.append(('keyframes', is_video, keyframes))
+
+    if opts.index:
+        ix = importlib.import_module('indexer')
+
+        def index(f: str) -> Optional[str]:
+            log(ix.index_file(f, opts.lsmas)[1])
+            return f
+
+        tools.append(('index', lambda f: os.path.splitext(f)[1].lower() in ix.video_extensions, index))
+
+    if opts.encode:
+        ea = importlib.import_module('encode_audio')
+        encode_parser = ea.build_parser()
+        ea.args = encode_parser.parse_args(shlex.split(opts.encode_args))
+        ea.check_args(encode_parser, ea.args)
+        ea.manifest = None if ea.args.no_manifest else ea.JobManifest()
+
+        def encode(f: str) -> Optional[str]:
+            if ea.manifest and f in ea.manifest.outputs():
+                return f
+
+            wav_only = os.path.splitext(f)[1].lower() in ea.wav_only_extensions
+            # Don't treat the outputs as new sources once they show up
+            ignored.update(ea.requested_outputs(f) if not wav_only else ())
+            for out, code in ea.encode_main(f, wav_only).items():
+                log(f"[!] Encoding {out} failed (exit status {code})")
+            return f if os.path.exists(f) else None
+
+        tools.append(('encode', ea.is_source, encode))
+
+    if opts.crc:
+        spec = importlib.util.spec_from_file_location(
+            'auto_crc', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'auto-CRC.py'))
+        ac = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(ac)
+
+        def crc(f: str) -> Optional[str]:
+            return ac.apply_crc(f, ac.calculate_crc(f))
+
+        tools.append(('crc', lambda f: os.path.splitext(f)[1].lower() in ac.video_extensions, crc))
+
+    return tools
+
+
+def worker(work: queue.Queue, tools: List[Tool], processed: Set[tuple]) -> None:
+    while (f := work.get()) is not None:
+        start = time.perf_counter()
+        try:
+            for name, applies, run in tools:
+                if f is None:
+                    break
+                if applies(f):
+                    f = run(f)
+        except Exception as e:  # keep watching, whatever a single file does
+            log(f"[!] {f}: {type(e).__name__}: {e}")
+        else:
+            log(f"[+] {f or 'file'} done in {time.perf_counter() - start:.1f}s")
+        finally:
+            if f and (fp := fingerprint(f)):
+                processed.add(fp)
+            work.task_done()
+
+
+def main() -> None:
+    ignored: Set[str] = set()
+    processed: Set[tuple] = set()
+    tools = load_tools(args, ignored)
+
+    if not tools:
+        log("[!] No tools enabled, nothing to do")
+        return
+
+    use_inotify = _inotify_available and not args.poll
+    watcher = InotifyWatcher(args.recursive) if use_inotify else Poller(args.recursive)
+    debouncer = Debouncer(args.settle)
+
+    if args.initial:
+        for m in discovery.walk(recursive=args.recursive, kinds={'video', 'audio'}):
+            debouncer.touch(m.path)
+
+    # The queue is bounded, so a burst of new files can't run ahead of the workers
+    work: queue.Queue = queue.Queue(maxsize=args.queue_size)
+    threads = [threading.Thread(target=worker, args=(work, tools, processed), daemon=True)
+               for _ in range(args.jobs)]
+    for t in threads:
+        t.start()
+
+    log(f"[*] Watching {os.getcwd()} ({'inotify' if use_inotify else 'polling'}), "
+        f"running: {', '.join(name for name, _, _ in tools)}")
+
+    try:
+        while True:
+            for f in watcher.changes(args.interval):
+                if f not in ignored:
+                    debouncer.touch(f)
+
+            for f in debouncer.ready():
+                # Renaming (like auto-CRC does) keeps the fingerprint, so renamed files aren't redone
+                if fingerprint(f) not in processed and f not in ignored:
+                    log(f"[*] Queued {f}")
+                    work.put(f)
+    except KeyboardInterrupt:
+        log("[*] Stopping, waiting for running jobs to finish")
+
+    for _ in threads:
+        work.put(None)
+    for t in threads:
+        t.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-R", "--recursive",
+                        action="store_true", default=False,
+                        help="watch subdirectories too (default: %(default)s)")
+    parser.add_argument("--keyframes",
+                        action="store_true", default=False,
+                        help="generate keyframes for new videos (default: %(default)s)")
+    parser.add_argument("--keyframes-args",
+                        action="store", default="",
+                        help="arguments passed on to generate_keyframes.py (default: %(default)r)")
+    parser.add_argument("--index",
+                        action="store_true", default=False,
+                        help="index new videos (default: %(default)s)")
+    parser.add_argument("--lsmas",
+                        action="store_true", default=False,
+                        help="force l-smash for indexing (default: %(default)s)")
+    parser.add_argument("--encode",
+                        action="store_true", default=False,
+                        help="encode the audio of new files (default: %(default)s)")
+    parser.add_argument("--encode-args",
+                        action="store", default="--keep",
+                        help="arguments passed on to encode_audio.py (default: %(default)r)")
+    parser.add_argument("--crc",
+                        action="store_true", default=False,
+                        help="append CRC-32s to new videos (default: %(default)s)")
+    parser.add_argument("-J", "--jobs",
+                        action="store", type=int, default=1,
+                        help="number of files to process at the same time (default: %(default)s)")
+    parser.add_argument("--queue-size",
+                        action="store", type=int, default=16,
+                        help="maximum number of files waiting to be processed (default: %(default)s)")
+    parser.add_argument("--settle",
+                        action="store", type=float, default=5.0,
+                        help="seconds a file's size and mtime must stay the same before it's processed (default: %(default)s)")
+    parser.add_argument("--interval",
+                        action="store", type=float, default=1.0,
+                        help="seconds between checks for new files (default: %(default)s)")
+    parser.add_argument("--poll",
+                        action="store_true", default=False,
+                        help="poll even if inotify is available (default: %(default)s)")
+    parser.add_argument("--initial",
+                        action="store_true", default=False,
+                        help="also process the files that are already there (default: %(default)s)")
+    parser.add_argument("--telemetry",
+                        action="store", default=None, metavar="LOG",
+                        help="append an event per file and tool to this JSON-lines log (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.jobs < 1 or args.queue_size < 1:
+        parser.error("--jobs and --queue-size must be at least 1")
+
+    telemetry.configure(args.telemetry)
+
+    main()